@@ -1,17 +1,61 @@
 #==================================================================================================================================
 # client.py - Copyright Vess 2023
-# Proof of concept for a shared memory chat client in Python. Uses a simple read / write flag to check for messages.
+# Proof of concept for a shared memory chat client in Python. Each client writes to its own single producer ring buffer,
+# which every other client follows with its own read cursor. A header keeps a registry of which client slots are in use.
+# Messages are framed with a fixed header holding their length, sequence number, and sender, so payloads can be any bytes.
+# An optional history log, memory mapped from a file next to the segment, lets late joining clients replay recent messages.
+# Messages too big for one frame are streamed through the ring in fragments, and put back together by each reader.
+# A named pipe next to the segment wakes the other clients' reader threads as soon as a message is published.
+# Running it with "bench" instead pushes messages between two processes and reports throughput, latency, and losses.
 #==================================================================================================================================
 # Known Bugs, Issues, and Limitations
-# 1. If client 1 joins and sends a message, the "connect message" will be lost.
-# 2. A client has to send an empty message to recieve updates. Due to timing, messages can be lost.
-# 3. There is no message queue for either user, which sort of leads to the two aforementioned issues. It is trivial to implement.
+# 1. If a client's ring buffer fills up before every other client reads it, new messages are refused until there is room.
+# 2. Incoming messages are printed over the prompt, so a half typed message will look split on screen.
+# 3. Without named pipes (Windows), the reader thread falls back to polling the segment.
+# 4. Without fcntl (Windows), joining and leaving isn't locked, so two clients starting at the same moment could collide.
+# 5. Fragmented messages, and messages over half the history log, aren't kept in it. Streaming a fragmented message waits on
+#    the slowest reader.
 #==================================================================================================================================
 
 # Imports.
+import collections
+import mmap
 import os
+import select
+import struct
 import sys
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker
 from multiprocessing import shared_memory
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+#==================================================================================================================================
+
+# Constants.
+MEM_NAME = "chat"
+MEM_MAGIC = 0x54414843
+MEM_HEADER = struct.Struct("<QQQQQ")
+MEM_SLOT = struct.Struct("<QQQ")
+MEM_CURSOR = struct.Struct("<Q")
+FRAME_HEADER = struct.Struct("<IHHQ")
+FRAME_ALIGN = 8
+FRAME_PAD = 0xFFFFFFFF
+FRAME_MORE = 1
+FRAME_CONT = 2
+FRAG_WAIT = 0.0001
+LOG_HEADER = struct.Struct("<QQ")
+LOG_SIZE = 1048576
+BENCH_STAMP = struct.Struct("<QQ")
+BENCH_COUNT = 100000
+BENCH_SIZE = 64
+MEM_DEFAULT = 65536
+SLOT_DEFAULT = 16
+NOTIFY_POLL = 0.05
 
 #==================================================================================================================================
 
@@ -29,99 +73,541 @@ def client_debug():
 
 #==================================================================================================================================
 
-# Setup the shared memory block.
-def mem_setup(mem_size):
-	client_num = 1
-	# Try to create a shared memory block. If it already exists, just connect to it.
+# Find the byte offset of a client's registry slot, which holds its pid (0 when free), its ring head, and its next sequence.
+def slot_offset(client_num):
+	return MEM_HEADER.size + (client_num-1)*MEM_SLOT.size
+
+# Find the byte offset of the cursor a reader keeps for a writer's ring.
+def cursor_offset(slot_count, client_reader, client_writer):
+	return MEM_HEADER.size + slot_count*MEM_SLOT.size + ((client_reader-1)*slot_count + (client_writer-1))*MEM_CURSOR.size
+
+# Find the byte offset of a client's ring buffer.
+def ring_offset(slot_count, ring_size, client_num):
+	return MEM_HEADER.size + slot_count*MEM_SLOT.size + slot_count*slot_count*MEM_CURSOR.size + (client_num-1)*ring_size
+
+# Find the ring size that fits a segment of a certain size and slot count. Rings are kept aligned for the frame headers.
+def ring_fit(mem_size, slot_count):
+	ring_size = (mem_size - MEM_HEADER.size - slot_count*MEM_SLOT.size - slot_count*slot_count*MEM_CURSOR.size) // slot_count
+	return ring_size - (ring_size % FRAME_ALIGN)
+
+#==================================================================================================================================
+
+# Hold the chat lock file while joining or leaving, since claiming a registry slot isn't atomic on its own.
+def lock_setup(mem_name):
+	lock_handle = open(os.path.join(tempfile.gettempdir(), mem_name + ".lock"), "a")
+	if fcntl:
+		fcntl.flock(lock_handle, fcntl.LOCK_EX)
+	return lock_handle
+
+# Let go of the chat lock file.
+def lock_shutdown(lock_handle):
+	if fcntl:
+		fcntl.flock(lock_handle, fcntl.LOCK_UN)
+	lock_handle.close()
+	return
+
+# Check if a process is still alive, so slots left behind by a crashed client can be reclaimed.
+def pid_alive(client_pid):
+	try:
+		os.kill(client_pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+#==================================================================================================================================
+
+# Setup the shared memory block and claim a free client slot in its registry.
+# If the history log is used, also replay up to the last log count messages. The creator decides if the log is used, and how
+# many messages are replayed for clients that don't ask for a count of their own.
+def mem_setup(mem_size, slot_count, log_count=0, mem_name=MEM_NAME):
+	lock_handle = lock_setup(mem_name)
+	# Try to create a shared memory block. If it already exists, just connect to it and use the layout in its header.
+	mem_created = False
+	try:
+		mem_share = shared_memory.SharedMemory(name=mem_name, create=True, size=mem_size)
+		mem_created = True
+		MEM_HEADER.pack_into(mem_share.buf, 0, MEM_MAGIC, slot_count, ring_fit(mem_size, slot_count), LOG_SIZE if log_count else 0, log_count)
+	except FileExistsError:
+		mem_share = shared_memory.SharedMemory(name=mem_name, create=False)
+	# Every process's resource tracker unlinks the segments it has opened when it exits, which would pull the segment out from
+	# under the clients still in it. Only the last client to leave unlinks it instead.
+	if os.name == "posix":
+		resource_tracker.unregister(mem_share._name, "shared_memory")
+	mem_magic, slot_count, ring_size, log_size, mem_count = MEM_HEADER.unpack_from(mem_share.buf, 0)
+	if mem_magic != MEM_MAGIC:
+		lock_shutdown(lock_handle)
+		mem_share.close()
+		print("Error: The chat segment exists but wasn't made by this client.")
+		exit()
+	# Take the first slot that is free, or that belongs to a client that died without leaving.
+	client_num = 0
+	for temp_num in range(1, slot_count+1):
+		slot_pid = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(temp_num))[0]
+		if slot_pid == 0 or not pid_alive(slot_pid):
+			client_num = temp_num
+			break
+	if client_num == 0:
+		lock_shutdown(lock_handle)
+		mem_share.close()
+		print("Error: All " + str(slot_count) + " client slots are in use.")
+		exit()
+	# Start reading every ring from its current head, then publish our pid so writers start counting our cursors.
+	for temp_num in range(1, slot_count+1):
+		_, slot_head, _ = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(temp_num))
+		MEM_CURSOR.pack_into(mem_share.buf, cursor_offset(slot_count, client_num, temp_num), slot_head)
+	_, slot_head, slot_seq = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(client_num))
+	MEM_SLOT.pack_into(mem_share.buf, slot_offset(client_num), os.getpid(), slot_head, slot_seq)
+	# Writers log and publish under the same lock, so the replay lines up exactly with where our cursors start.
+	log_map = None
+	log_messages = []
+	if log_size:
+		log_map = log_setup(mem_name, log_size, mem_created)
+		log_messages = log_replay(log_map, log_count if log_count else mem_count)
+	lock_shutdown(lock_handle)
+	print("You are client " + str(client_num) + ".")
+	return mem_share, [client_num, slot_count, ring_size, log_map, {}], log_messages
+
+# Give our slot back. Returns True if we were the last living client, meaning the segment should be unlinked.
+def mem_leave(mem_share, client_data):
+	client_num, slot_count, ring_size, log_map, _ = client_data
+	lock_handle = lock_setup(mem_share.name)
+	_, slot_head, slot_seq = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(client_num))
+	MEM_SLOT.pack_into(mem_share.buf, slot_offset(client_num), 0, slot_head, slot_seq)
+	slot_pids = [MEM_SLOT.unpack_from(mem_share.buf, slot_offset(temp_num))[0] for temp_num in range(1, slot_count+1)]
+	mem_last = not any(temp_pid != 0 and pid_alive(temp_pid) for temp_pid in slot_pids)
+	lock_shutdown(lock_handle)
+	if log_map:
+		log_map.close()
+	return mem_last
+
+# Unlink the segment. Another client may have beaten us to it after a crash, which is fine.
+# Unlinking tells the resource tracker to forget the segment, so it is handed back to the tracker first.
+def mem_unlink(mem_share):
+	if os.name == "posix":
+		resource_tracker.register(mem_share._name, "shared_memory")
+	try:
+		mem_share.unlink()
+	except FileNotFoundError:
+		if os.name == "posix":
+			resource_tracker.unregister(mem_share._name, "shared_memory")
+	return
+
+# Return the client numbers of every slot currently in use.
+def mem_clients(mem_share, slot_count):
+	return [temp_num for temp_num in range(1, slot_count+1) if MEM_SLOT.unpack_from(mem_share.buf, slot_offset(temp_num))[0] != 0]
+
+#==================================================================================================================================
+
+# Find how many bytes a frame takes up in a ring, including its header and alignment padding.
+def frame_size(frame_len):
+	frame_total = FRAME_HEADER.size + frame_len
+	return frame_total + (-frame_total % FRAME_ALIGN)
+
+# Find how far a ring's head moves to write a frame. Frames never wrap, so the tail end of the ring is skipped if too short.
+def frame_space(ring_size, ring_pos, frame_len):
+	ring_left = ring_size - (ring_pos % ring_size)
+	if ring_left < frame_size(frame_len):
+		return ring_left + frame_size(frame_len)
+	return frame_size(frame_len)
+
+# Write a frame into a ring at a position, and return the position after it. The cursors only ever grow, and are wrapped on access.
+def frame_write(mem_buf, ring_start, ring_size, ring_pos, frame_sender, frame_flags, frame_seq, frame_data):
+	ring_left = ring_size - (ring_pos % ring_size)
+	if ring_left < frame_size(len(frame_data)):
+		# Mark the skipped space as padding when there is room for a header, otherwise readers skip it on their own.
+		if ring_left >= FRAME_HEADER.size:
+			FRAME_HEADER.pack_into(mem_buf, ring_start + (ring_pos % ring_size), FRAME_PAD, 0, 0, 0)
+		ring_pos += ring_left
+	frame_start = ring_start + (ring_pos % ring_size)
+	FRAME_HEADER.pack_into(mem_buf, frame_start, len(frame_data), frame_sender, frame_flags, frame_seq)
+	mem_buf[frame_start+FRAME_HEADER.size:frame_start+FRAME_HEADER.size+len(frame_data)] = frame_data
+	return ring_pos + frame_size(len(frame_data))
+
+# Read the frame header at a ring position. Returns the header, the start of its payload, and the position after it.
+# Padding is skipped, so the returned frame is always a real one as long as the position is behind the head.
+def frame_read(mem_buf, ring_start, ring_size, ring_pos):
+	ring_left = ring_size - (ring_pos % ring_size)
+	if ring_left >= FRAME_HEADER.size:
+		frame_len, frame_sender, frame_flags, frame_seq = FRAME_HEADER.unpack_from(mem_buf, ring_start + (ring_pos % ring_size))
+		if frame_len != FRAME_PAD:
+			frame_start = ring_start + (ring_pos % ring_size) + FRAME_HEADER.size
+			return [frame_len, frame_sender, frame_flags, frame_seq], frame_start, ring_pos + frame_size(frame_len)
+	return frame_read(mem_buf, ring_start, ring_size, ring_pos + ring_left)
+
+# Find how far the slowest active reader of a ring is, which is where the writer has to stop.
+def ring_tail(mem_share, client_data):
+	client_num, slot_count, ring_size, _, _ = client_data
+	_, ring_head, _ = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(client_num))
+	ring_min = ring_head
+	for temp_num in mem_clients(mem_share, slot_count):
+		# A reader that crashed would hold the ring up forever, so only count the living.
+		if temp_num != client_num and pid_alive(MEM_SLOT.unpack_from(mem_share.buf, slot_offset(temp_num))[0]):
+			ring_min = min(ring_min, MEM_CURSOR.unpack_from(mem_share.buf, cursor_offset(slot_count, temp_num, client_num))[0])
+	return ring_min
+
+#==================================================================================================================================
+
+# Print a message from another client.
+def mem_print(frame_sender, frame_seq, frame_view):
+	print("\rClient " + str(frame_sender) + ": " + str(frame_view, "utf-8", "replace"))
+	return
+
+# Drain every queued message from the other clients' ring buffers in order. Returns the message count.
+# Each payload is handed to the handler as a memoryview straight into the ring, which is only valid during the call.
+# Fragments are collected per writer, and the message is handed over once its last fragment arrives.
+def mem_read(mem_share, client_data, mem_handler=mem_print):
+	client_num, slot_count, ring_size, _, frag_cache = client_data
+	mem_count = 0
+	for temp_num in range(1, slot_count+1):
+		if temp_num == client_num:
+			continue
+		_, ring_head, _ = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(temp_num))
+		ring_cursor = MEM_CURSOR.unpack_from(mem_share.buf, cursor_offset(slot_count, client_num, temp_num))[0]
+		# A writer only laps us if we joined while it was mid write. Skip ahead instead of reading garbage.
+		if ring_head - ring_cursor > ring_size:
+			print("\rClient " + str(temp_num) + ": [Some messages were missed.]")
+			ring_cursor = ring_head
+			frag_cache.pop(temp_num, None)
+		ring_start = ring_offset(slot_count, ring_size, temp_num)
+		while ring_cursor < ring_head:
+			frame_header, frame_start, ring_cursor = frame_read(mem_share.buf, ring_start, ring_size, ring_cursor)
+			frame_len, frame_sender, frame_flags, frame_seq = frame_header
+			with mem_share.buf[frame_start:frame_start+frame_len] as frame_view:
+				if frame_flags & FRAME_CONT and temp_num not in frag_cache:
+					# We joined in the middle of a stream, so drop the rest of it.
+					pass
+				elif frame_flags & FRAME_MORE:
+					frag_cache.setdefault(temp_num, bytearray()).extend(frame_view)
+				elif frame_flags & FRAME_CONT:
+					frag_data = frag_cache.pop(temp_num)
+					frag_data.extend(frame_view)
+					mem_handler(frame_sender, frame_seq, memoryview(frag_data))
+					mem_count += 1
+				else:
+					mem_handler(frame_sender, frame_seq, frame_view)
+					mem_count += 1
+			# Only this reader moves its own cursor, which hands the space back to the writer once everyone has moved theirs.
+			MEM_CURSOR.pack_into(mem_share.buf, cursor_offset(slot_count, client_num, temp_num), ring_cursor)
+	return mem_count
+
+# Write a single frame to our ring buffer and wake the other clients. Returns False if there isn't enough free space for it.
+# Every fragment of a message shares its sequence number, which only moves on once the last fragment is written.
+def frame_publish(mem_share, client_data, frame_flags, frame_data):
+	client_num, slot_count, ring_size, log_map, _ = client_data
+	slot_pid, ring_head, slot_seq = MEM_SLOT.unpack_from(mem_share.buf, slot_offset(client_num))
+	if frame_space(ring_size, ring_head, len(frame_data)) > ring_size - (ring_head - ring_tail(mem_share, client_data)):
+		return False
+	if log_map and not frame_flags:
+		lock_handle = lock_setup(mem_share.name)
+		log_write(log_map, client_num, slot_seq, frame_data)
+	ring_head = frame_write(mem_share.buf, ring_offset(slot_count, ring_size, client_num), ring_size, ring_head, client_num, frame_flags, slot_seq, frame_data)
+	# Only the writer moves the head, and only after the frame is fully written.
+	MEM_SLOT.pack_into(mem_share.buf, slot_offset(client_num), slot_pid, ring_head, slot_seq + (0 if frame_flags & FRAME_MORE else 1))
+	if log_map and not frame_flags:
+		lock_shutdown(lock_handle)
+	for temp_num in mem_clients(mem_share, slot_count):
+		if temp_num != client_num:
+			notify_send(mem_share.name, temp_num)
+	return True
+
+# Queue a message in our ring buffer and wake the other clients. Returns False if there isn't enough free space for it.
+# A message too big for a single frame is streamed in fragments instead, waiting on the readers whenever the ring fills up.
+# Frames never wrap, so only a frame of up to half the ring is sure to fit wherever the head is.
+def mem_write(mem_share, client_data, mem_message):
+	ring_size = client_data[2]
+	if frame_size(len(mem_message)) <= ring_size // 2:
+		return frame_publish(mem_share, client_data, 0, mem_message)
+	# Keep fragments to a quarter of the ring, so readers can drain some while the next ones are written.
+	frag_len = max(FRAME_ALIGN, ring_size//4 - FRAME_HEADER.size)
+	with memoryview(mem_message) as mem_view:
+		for temp_start in range(0, len(mem_message), frag_len):
+			frame_flags = FRAME_CONT if temp_start else 0
+			if temp_start + frag_len < len(mem_message):
+				frame_flags |= FRAME_MORE
+			while not frame_publish(mem_share, client_data, frame_flags, mem_view[temp_start:temp_start+frag_len]):
+				time.sleep(FRAG_WAIT)
+	return True
+
+#==================================================================================================================================
+
+# Map the history log file next to the chat segment, creating it or resetting it if it isn't the expected size.
+# The client that creates the segment also resets the log, so a new chat never replays an old one.
+def log_setup(mem_name, log_size, log_reset=False):
+	log_file = os.path.join(tempfile.gettempdir(), mem_name + ".log")
+	log_handle = open(log_file, "a+b")
+	if log_reset or os.path.getsize(log_file) != log_size:
+		log_handle.truncate(0)
+		log_handle.truncate(log_size)
+	log_map = mmap.mmap(log_handle.fileno(), log_size)
+	log_handle.close()
+	return log_map
+
+# Append a frame to the history log, dropping the oldest frames to make room. The caller must hold the chat lock.
+# Frames never wrap, so like the rings, only a frame of up to half the log is sure to fit and anything bigger isn't logged.
+def log_write(log_map, frame_sender, frame_seq, frame_data):
+	log_size = len(log_map) - LOG_HEADER.size
+	log_head, log_tail = LOG_HEADER.unpack_from(log_map, 0)
+	if frame_size(len(frame_data)) > log_size // 2:
+		return
+	while log_tail < log_head and frame_space(log_size, log_head, len(frame_data)) > log_size - (log_head - log_tail):
+		_, _, log_tail = frame_read(log_map, LOG_HEADER.size, log_size, log_tail)
+	log_head = frame_write(log_map, LOG_HEADER.size, log_size, log_head, frame_sender, 0, frame_seq, frame_data)
+	LOG_HEADER.pack_into(log_map, 0, log_head, log_tail)
+	return
+
+# Return the last log count messages in the history log. The log is copied in one bulk read and then parsed.
+def log_replay(log_map, log_count):
+	log_size = len(log_map) - LOG_HEADER.size
+	log_head, log_tail = LOG_HEADER.unpack_from(log_map, 0)
+	log_data = log_map[:]
+	log_messages = collections.deque(maxlen=log_count)
+	while log_tail < log_head:
+		frame_header, frame_start, log_tail = frame_read(log_data, LOG_HEADER.size, log_size, log_tail)
+		log_messages.append([frame_header[1], frame_header[3], log_data[frame_start:frame_start+frame_header[0]]])
+	return list(log_messages)
+
+#==================================================================================================================================
+
+# Find the named pipe used to wake up a client. It lives in the temp folder next to the chat segment.
+def notify_path(mem_name, client_num):
+	return os.path.join(tempfile.gettempdir(), mem_name + "_" + str(client_num) + ".fifo")
+
+# Create the named pipe that wakes up our reader. Returns None if named pipes aren't supported.
+def notify_setup(mem_name, client_num):
+	if not hasattr(os, "mkfifo"):
+		return None
+	notify_file = notify_path(mem_name, client_num)
+	# Replace any pipe left over from a client that crashed.
+	if os.path.exists(notify_file):
+		os.remove(notify_file)
+	os.mkfifo(notify_file)
+	# Open it for reading and writing so it never hits end of file while nobody else has it open.
+	return os.open(notify_file, os.O_RDWR)
+
+# Wake up a client by writing a byte to its named pipe. A client that isn't listening yet drains its ring when it starts.
+def notify_send(mem_name, client_num):
 	try:
-		mem_share = shared_memory.SharedMemory(name="chat", create=True, size=mem_size)
-		print("You are client 1.")
-		client_num = 1
-		client_offset = 0
-		client_mid = (mem_size//2)
-		client_max = mem_size
-	except:
-		mem_share = shared_memory.SharedMemory(name="chat", create=False, size=mem_size)
-		print("You are client 2.")
-		client_num = 2
-		client_offset = (mem_size//2)
-		client_mid = 0
-		client_max = client_offset
-	return mem_share, [client_num, client_offset, client_mid, client_max]
-
-#==================================================================================================================================
-
-# Check if the read flag is on. If so, unset it and print the message.
-def mem_read(mem_share, client_num, client_mid, client_max):
-	# Invert the client number.
-	client_other = str(1+(client_num%2))
-	# Read a message only if the flag is set.
-	if mem_share.buf[client_mid:client_mid+1] == bytes("*", "utf-8"):
-		mem_message = str(bytes(mem_share.buf[client_mid+1:client_max]).decode()).split("#")[0]
-		print("Client " + client_other + ": " + mem_message)
-		mem_share.buf[client_mid:client_mid+1] = bytes(" ", "utf-8")
+		notify_fd = os.open(notify_path(mem_name, client_num), os.O_WRONLY | os.O_NONBLOCK)
+	except OSError:
+		return
+	# A full pipe already has a wakeup waiting in it, so that error is safe to ignore.
+	try:
+		os.write(notify_fd, b"*")
+	except OSError:
+		pass
+	os.close(notify_fd)
 	return
 
-# Set the read flag to on, and write a message to the memory.
-def mem_write(mem_share, client_offset, mem_message):
-	mem_share.buf[client_offset:client_offset+1] = bytes("*", "utf-8")
-	mem_padding = len(mem_message)
-	mem_share.buf[client_offset+1:client_offset+len(mem_message)+2] = bytes(mem_message + "#", "utf-8")
+# The reader thread. Sleeps on the named pipe, or polls without one, and drains the ring buffers every time it wakes.
+def notify_listen(mem_share, client_data, notify_fd, notify_stop):
+	client_num = client_data[0]
+	while not notify_stop.is_set():
+		if mem_read(mem_share, client_data):
+			# Put the prompt back after printing over it.
+			print("Client " + str(client_num) + ": ", end="", flush=True)
+		if notify_fd is None:
+			time.sleep(NOTIFY_POLL)
+		else:
+			os.read(notify_fd, 4096)
+	return
+
+# Stop the reader thread and remove our named pipe.
+def notify_shutdown(mem_name, client_num, notify_fd, notify_thread, notify_stop):
+	notify_stop.set()
+	if notify_fd is not None:
+		os.write(notify_fd, b"*")
+	notify_thread.join()
+	if notify_fd is not None:
+		os.close(notify_fd)
+		os.remove(notify_path(mem_name, client_num))
 	return
 
 #==================================================================================================================================
 
 # Setup the client and begin to listen to the shared memory block.
-def client_setup(mem_share, mem_size, client_data):
-	client_num, client_offset, client_mid, client_max = client_data
+def client_setup(mem_share, client_data, log_messages):
+	client_num, slot_count, ring_size, _, _ = client_data
 	client_clear()
 	user_input = ""
-	mem_write(mem_share, client_offset, "[Has connected.]")
-	mem_read(mem_share, client_num, client_mid, client_max)
-	# / will be considered a special character that by itself ends the program.
+	for temp_sender, temp_seq, temp_message in log_messages:
+		mem_print(temp_sender, temp_seq, temp_message)
+	# Start listening before connecting, so nothing sent from here on can be missed.
+	notify_fd = notify_setup(mem_share.name, client_num)
+	notify_stop = threading.Event()
+	notify_thread = threading.Thread(target=notify_listen, args=(mem_share, client_data, notify_fd, notify_stop), daemon=True)
+	notify_thread.start()
+	mem_write(mem_share, client_data, bytes("[Has connected.]", "utf-8"))
+	# / will be considered a special character that by itself ends the program, and /file sends a file's contents.
 	while True:
 		user_input = input("Client " + str(client_num) + ": ")
-		# Check the message length.
-		if (len(user_input)+2) >= (mem_size//2):
-			print("Error: That message is too long and won't be sent.")
-		# Check for a reserved character.
-		if "#" in user_input:
-			print("Error: # is a reserved character.")
+		# Check for a file to send.
+		if user_input.startswith("/file "):
+			try:
+				file_handle = open(user_input[6:], "rb")
+			except OSError:
+				print("Error: That file can't be opened.")
+				continue
+			mem_write(mem_share, client_data, file_handle.read())
+			file_handle.close()
+			continue
 		# Check for the end character.
 		if user_input == "/":
-			mem_write(mem_share, client_offset, "[Has disconnected.]")
+			mem_write(mem_share, client_data, bytes("[Has disconnected.]", "utf-8"))
+			notify_shutdown(mem_share.name, client_num, notify_fd, notify_thread, notify_stop)
 			return
 		# Check if empty input.
 		if user_input != "":
-			mem_write(mem_share, client_offset, user_input)
-		mem_read(mem_share, client_num, client_mid, client_max)
+			if not mem_write(mem_share, client_data, bytes(user_input, "utf-8")):
+				print("Error: The message queue is full and the message won't be sent.")
+	return
+
+#==================================================================================================================================
+
+# Find a percentile of an already sorted list of samples.
+def bench_percentile(bench_samples, bench_pct):
+	if not bench_samples:
+		return 0
+	return bench_samples[min(len(bench_samples)-1, int(len(bench_samples) * bench_pct / 100))]
+
+# The producer side of the benchmark. Each payload starts with its send time and sequence, and is padded out to size.
+def bench_produce(mem_size, mem_name, bench_count, bench_size):
+	mem_share, client_data, _ = mem_setup(mem_size, 2, 0, mem_name)
+	bench_padding = bytes(max(0, bench_size - BENCH_STAMP.size))
+	bench_stalls = 0
+	for temp_seq in range(bench_count):
+		bench_payload = BENCH_STAMP.pack(time.perf_counter_ns(), temp_seq) + bench_padding
+		# Spin while the ring is full, the reader is never waited on in any other way.
+		while not mem_write(mem_share, client_data, bench_payload):
+			bench_stalls += 1
+			time.sleep(0)
+	print("Producer status: Sent " + str(bench_count) + " messages, stalled on a full ring " + str(bench_stalls) + " times.")
+	mem_leave(mem_share, client_data)
+	mem_share.close()
+	return
+
+# The consumer side of the benchmark. Sleeps on its named pipe like a chat client, and times every message it drains.
+def bench_consume(mem_share, client_data, notify_fd, bench_count, proc_pid):
+	bench_stats = {"latency": [], "bytes": 0, "lost": 0, "corrupt": 0, "next": 0, "first": 0, "last": 0}
+	def bench_handler(frame_sender, frame_seq, frame_view):
+		bench_time = time.perf_counter_ns()
+		bench_sent, bench_seq = BENCH_STAMP.unpack_from(frame_view, 0)
+		# A gap in the sequence is a lost message, and a payload that disagrees with its header was overwritten.
+		if frame_seq != bench_stats["next"]:
+			bench_stats["lost"] += frame_seq - bench_stats["next"]
+		if bench_seq != frame_seq:
+			bench_stats["corrupt"] += 1
+		if not bench_stats["first"]:
+			bench_stats["first"] = bench_sent
+		bench_stats["next"] = frame_seq + 1
+		bench_stats["last"] = bench_time
+		bench_stats["bytes"] += len(frame_view)
+		bench_stats["latency"].append(bench_time - bench_sent)
+		return
+	proc_done = False
+	while bench_stats["next"] < bench_count:
+		mem_read(mem_share, client_data, bench_handler)
+		if proc_done:
+			break
+		# Wake up every so often to check that the producer hasn't died, in case the last messages never come.
+		if select.select([notify_fd], [], [], 1)[0]:
+			os.read(notify_fd, 4096)
+		elif os.waitpid(proc_pid, os.WNOHANG)[0] != 0:
+			proc_done = True
+	if not proc_done:
+		os.waitpid(proc_pid, 0)
+	bench_stats["lost"] += bench_count - bench_stats["next"]
+	return bench_stats
+
+# Run the benchmark on a private segment, with the parent reading and a forked child writing.
+def bench_setup(mem_size, bench_count, bench_size):
+	mem_name = MEM_NAME + "_bench_" + str(os.getpid())
+	mem_share, client_data, _ = mem_setup(mem_size, 2, 0, mem_name)
+	notify_fd = notify_setup(mem_name, client_data[0])
+	proc_pid = os.fork()
+	if proc_pid == 0:
+		bench_produce(mem_size, mem_name, bench_count, bench_size)
+		os._exit(0)
+	bench_stats = bench_consume(mem_share, client_data, notify_fd, bench_count, proc_pid)
+	os.close(notify_fd)
+	os.remove(notify_path(mem_name, client_data[0]))
+	mem_leave(mem_share, client_data)
+	mem_share.close()
+	mem_unlink(mem_share)
+	os.remove(os.path.join(tempfile.gettempdir(), mem_name + ".lock"))
+	# Report the results.
+	bench_latency = sorted(bench_stats["latency"])
+	bench_time = max(1, bench_stats["last"] - bench_stats["first"]) / 1e9
+	print("Bench status: Received " + str(len(bench_latency)) + " of " + str(bench_count) + " messages of " + str(bench_size) + " bytes.")
+	print("Bench status: " + str(round(len(bench_latency) / bench_time)) + " messages/sec, " + str(round(bench_stats["bytes"] / bench_time / 1e6, 2)) + " MB/sec.")
+	print("Bench status: Latency p50 " + str(bench_percentile(bench_latency, 50) / 1e3) + " us, p99 " + str(bench_percentile(bench_latency, 99) / 1e3) + " us, p999 " + str(bench_percentile(bench_latency, 99.9) / 1e3) + " us.")
+	print("Bench status: Lost " + str(bench_stats["lost"]) + " messages, " + str(bench_stats["corrupt"]) + " overwritten.")
 	return
 
 #==================================================================================================================================
 
 if __name__ == "__main__":
-	# Get the total size of shared memory as a CLI argument.
-	mem_size = 100
+	# Run the benchmark instead of the chat if asked, with an optional message count, message size, and mem size.
+	if len(sys.argv) > 1 and sys.argv[1] == "bench":
+		bench_args = [BENCH_COUNT, BENCH_SIZE, MEM_DEFAULT]
+		for temp_index, temp_arg in enumerate(sys.argv[2:5]):
+			try:
+				bench_args[temp_index] = int(temp_arg)
+			except:
+				print("Error: Bench arguments must be numbers.")
+				exit()
+		if bench_args[1] < BENCH_STAMP.size:
+			print("Error: Bench message size cannot be less than " + str(BENCH_STAMP.size) + ".")
+			exit()
+		if ring_fit(bench_args[2], 2) < frame_size(1):
+			print("Error: Mem size is too small for 2 clients.")
+			exit()
+		bench_setup(bench_args[2], bench_args[0], bench_args[1])
+		exit()
+	# Get the total size of shared memory, the max number of clients, and how much history to replay as CLI arguments.
+	mem_size = MEM_DEFAULT
+	slot_count = SLOT_DEFAULT
+	log_count = 0
 	if len(sys.argv) > 1:
 		try:
 			int(sys.argv[1])
 		except:
 			print("Error: Mem size is not a number.")
 			exit()
-		if int(sys.argv[1]) <= 4:
-			print("Error: Mem size cannot be less than 4.")
+		mem_size = int(sys.argv[1])
+	if len(sys.argv) > 2:
+		try:
+			int(sys.argv[2])
+		except:
+			print("Error: Client max is not a number.")
 			exit()
-		if int(sys.argv[1])%2 != 0:
-			print("Error: Mem size is not divisable by 2.")
+		if int(sys.argv[2]) < 2:
+			print("Error: Client max cannot be less than 2.")
 			exit()
-		mem_size = int(sys.argv[1])
-	# Get a handle for a shared memory block, and the client type.
-	mem_share, client_data = mem_setup(mem_size)
+		slot_count = int(sys.argv[2])
+	if len(sys.argv) > 3:
+		try:
+			int(sys.argv[3])
+		except:
+			print("Error: History count is not a number.")
+			exit()
+		if int(sys.argv[3]) < 0:
+			print("Error: History count cannot be less than 0.")
+			exit()
+		log_count = int(sys.argv[3])
+	if ring_fit(mem_size, slot_count) < frame_size(1):
+		print("Error: Mem size is too small for " + str(slot_count) + " clients.")
+		exit()
+	# Get a handle for a shared memory block, and the client slot.
+	mem_share, client_data, log_messages = mem_setup(mem_size, slot_count, log_count)
 	# Start the client.
-	client_setup(mem_share, mem_size, client_data)
-	# Make sure to clean up the shared memory space.
+	client_setup(mem_share, client_data, log_messages)
+	# Make sure to clean up the shared memory space once the last client leaves.
+	mem_last = mem_leave(mem_share, client_data)
 	mem_share.close()
-	mem_share.unlink()
+	if mem_last:
+		mem_unlink(mem_share)
 	exit()
 
 #==================================================================================================================================
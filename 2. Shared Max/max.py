@@ -1,17 +1,48 @@
 #==================================================================================================================================
 # max.py - Copyright Vess 2023
-# Proof of concept for a shared memory max sort client. Each child finds the max of a smaller set of numbers.
+# Proof of concept for a shared memory max sort client. Each child reduces a smaller set of numbers to a partial result,
+# and the parent combines them. Any mix of reductions (min, max, sum, mean, argmax, top-k...) is done in the same pass.
+# Children send their partials back to the parent through a pipe, so any int or float can be returned.
+# The numbers are packed into a typed array in shared memory, and each child only gets the bounds of a contiguous block.
+# Children are forked once into a pool, and wait on a pipe for the next array, so repeated queries skip the fork.
+# An input file can be given instead, which each child memory maps and streams through its own byte range in blocks.
+# If NumPy is installed, typed windows are reduced by its kernels. Otherwise the builtins are used, which box every item.
+# A NaN wins min, max, argmin, and argmax, with the first NaN's index, the same with or without NumPy.
 #==================================================================================================================================
 # Known Bugs, Issues, and Limitations
-# 1. All numbers must currently be less than 255.
-# 2. No error checking on the input array.
+# 1. No error checking on the input array.
+# 2. Ints that don't fit in 64 bits can't be packed, so those arrays fall back to list slices sent through the job pipe.
+# 3. A mix of ints and floats is packed as floats, so ints past 2**53 lose precision there.
+# 4. With NumPy, float sums are added pairwise, so their last bits can differ from sum().
+# 5. Top-k has no order for NaN, so a NaN leaves the top numbers around it unsorted.
 #==================================================================================================================================
 
 # Imports.
+import array
+import functools
+import heapq
+import itertools
+import mmap
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+import operator
 import os
+import pickle
 import random
+import re
+import struct
 import sys
-import time
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+#==================================================================================================================================
+
+# Constants.
+FILE_CODES = {".i64": "q", ".f64": "d"}
+FILE_BLOCK = 1 << 24
+FILE_DELIM = re.compile(rb"[\s,]")
 
 #==================================================================================================================================
 
@@ -26,82 +57,481 @@ def client_clear():
 def array_debug(num_count):
 	array_random = []
 	for temp_itr in range(num_count):
-		array_random.append(random.randint(0, 255))
+		array_random.append(random.randint(-2**63, 2**63-1))
 	return array_random
 
 #==================================================================================================================================
 
-def array_split(input_list, array_count):
-	return [input_list[temp_itr::array_count] for temp_itr in range(array_count)]
+# Split a number of items into contiguous, evenly sized index ranges.
+def array_split(input_count, array_count):
+	return [range(temp_itr*input_count//array_count, (temp_itr+1)*input_count//array_count) for temp_itr in range(array_count)]
 
 #==================================================================================================================================
 
-# Get the array of numbers.
+# Pack the numbers into the pool's typed array in shared memory. Returns the type code, or None if they don't fit one.
+# A typed array.array or NumPy array of 64 bit ints or floats is copied in as is. A list is packed as ints, or as floats if
+# that fails on a float. The pool's memory is kept between queries, and only replaced with a bigger one when an array doesn't fit.
+def array_share(pool_data, input_nums):
+	array_typed = None
+	if isinstance(input_nums, array.array) and input_nums.typecode in FILE_CODES.values() and input_nums.itemsize == 8:
+		array_typed = input_nums
+	elif numpy is not None and isinstance(input_nums, numpy.ndarray) and input_nums.dtype.char in FILE_CODES.values():
+		array_typed = numpy.ascontiguousarray(input_nums)
+	else:
+		try:
+			array_typed = array.array("q", input_nums)
+		except TypeError:
+			try:
+				array_typed = array.array("d", input_nums)
+			except OverflowError:
+				return None
+		except OverflowError:
+			return None
+	array_code = array_typed.typecode if isinstance(array_typed, array.array) else array_typed.dtype.char
+	array_size = len(array_typed) * array_typed.itemsize
+	if pool_data["mem"] is None or pool_data["mem"].size < array_size:
+		if pool_data["mem"] is not None:
+			pool_data["mem"].close()
+			pool_data["mem"].unlink()
+		pool_data["mem"] = shared_memory.SharedMemory(create=True, size=max(4096, array_size * 2))
+	pool_data["mem"].buf[:array_size] = memoryview(array_typed).cast("B")
+	return array_code
+
+#==================================================================================================================================
+
+# Get the array of numbers. An empty line gives an empty array.
 def array_get(flag_debug):
 	if flag_debug:
 		array_size = random.randint(0, 100)
 		return array_debug(array_size)
-	print("Please define an array of numbers in the format of: 1, 2, 3")
+	print("Please define an array of numbers in the format of: 1, 2.5, 3")
 	input_user = input("> ")
+	if not input_user.strip():
+		return []
 	input_clean = input_user.replace(" ", "").split(",")
 	input_nums = list(
-		map(int, input_clean)
+		map(num_cast, input_clean)
 	)
-	if any(temp_x > 255 for temp_x in input_nums):
-		print("Error: No number can be greater than 255.")
-		exit()
 	return input_nums
 
+# Cast a string to an integer if it is one, otherwise to a float.
+def num_cast(input_str):
+	try:
+		return int(input_str)
+	except ValueError:
+		return float(input_str)
+
+#==================================================================================================================================
+
+# Each reduction is split into a partial over one child's window, a combine of two partials, a finish, and a shift.
+# Partials get the window's numbers and their indexes, counted from the start of the job. Combines must be associative.
+# Shifts move a partial's indexes once the parent knows how many numbers came before the job.
+# Windows are NumPy arrays over shared memory when NumPy is installed, so its kernels do the work without boxing a single item.
+# Otherwise they are memoryviews or lists, and the builtins turn every item into a Python number as they go.
+def partial_min(window_nums, window_index):
+	if window_numpy(window_nums):
+		return window_nums.min().item()
+	nan_index = window_nan(window_nums)
+	return window_nums[nan_index] if nan_index >= 0 else min(window_nums)
+
+def partial_max(window_nums, window_index):
+	if window_numpy(window_nums):
+		return window_nums.max().item()
+	nan_index = window_nan(window_nums)
+	return window_nums[nan_index] if nan_index >= 0 else max(window_nums)
+
+# NumPy adds ints with wrap around, so it is only trusted when no partial sum can leave 64 bits.
+def partial_sum(window_nums, window_index):
+	if window_numpy(window_nums):
+		if window_nums.dtype.char == "d":
+			return window_nums.sum().item()
+		if max(abs(window_nums.min().item()), abs(window_nums.max().item())) * len(window_nums) < 2**63:
+			return window_nums.sum().item()
+		return sum(window_nums.tolist())
+	return sum(window_nums)
+
+def partial_count(window_nums, window_index):
+	return len(window_nums)
+
+def partial_mean(window_nums, window_index):
+	return [partial_sum(window_nums, window_index), len(window_nums)]
+
+def partial_argmin(window_nums, window_index):
+	if window_numpy(window_nums):
+		num_index = window_nums.argmin().item()
+		return [window_nums[num_index].item(), window_index[num_index]]
+	num_index = window_nan(window_nums)
+	if num_index < 0:
+		num_index = operator.indexOf(window_nums, min(window_nums))
+	return [window_nums[num_index], window_index[num_index]]
+
+def partial_argmax(window_nums, window_index):
+	if window_numpy(window_nums):
+		num_index = window_nums.argmax().item()
+		return [window_nums[num_index].item(), window_index[num_index]]
+	num_index = window_nan(window_nums)
+	if num_index < 0:
+		num_index = operator.indexOf(window_nums, max(window_nums))
+	return [window_nums[num_index], window_index[num_index]]
+
+def partial_top(top_count, window_nums, window_index):
+	if window_numpy(window_nums):
+		if len(window_nums) > top_count:
+			window_nums = numpy.partition(window_nums, len(window_nums) - top_count)[len(window_nums) - top_count:]
+		return sorted(window_nums.tolist(), reverse=True)
+	return heapq.nlargest(top_count, window_nums)
+
+# Check if a window is a NumPy array.
+def window_numpy(window_nums):
+	return numpy is not None and isinstance(window_nums, numpy.ndarray)
+
+# Find the index of the first NaN in a window, or -1 if there is none. Windows of ints are skipped without a look.
+def window_nan(window_nums):
+	if isinstance(window_nums, memoryview) and window_nums.format != "d":
+		return -1
+	try:
+		return operator.indexOf(map(num_nan, window_nums), True)
+	except ValueError:
+		return -1
+
+# Check if a number is a NaN, the only number that isn't equal to itself.
+def num_nan(input_num):
+	return input_num != input_num
+
+# Order numbers for a max so a NaN beats everything, and for a min so a NaN comes before everything.
+def order_max(input_num):
+	return (num_nan(input_num), 0 if num_nan(input_num) else input_num)
+
+def order_min(input_num):
+	return (not num_nan(input_num), 0 if num_nan(input_num) else input_num)
+
+def combine_min(partial_a, partial_b):
+	return min(partial_a, partial_b, key=order_min)
+
+def combine_max(partial_a, partial_b):
+	return max(partial_a, partial_b, key=order_max)
+
+def combine_mean(partial_a, partial_b):
+	return [partial_a[0] + partial_b[0], partial_a[1] + partial_b[1]]
+
+# Ties go to the lowest index, so the result is the same no matter how the array was split.
+def combine_argmin(partial_a, partial_b):
+	return min(partial_a, partial_b, key=lambda temp_pair: order_min(temp_pair[0]) + (temp_pair[1],))
+
+def combine_argmax(partial_a, partial_b):
+	return max(partial_a, partial_b, key=lambda temp_pair: order_max(temp_pair[0]) + (-temp_pair[1],))
+
+def combine_top(top_count, partial_a, partial_b):
+	return heapq.nlargest(top_count, itertools.chain(partial_a, partial_b))
+
+def finish_mean(partial_final):
+	return partial_final[0] / partial_final[1]
+
+def finish_index(partial_final):
+	return partial_final[1]
+
+def finish_none(partial_final):
+	return partial_final
+
+def shift_index(partial_data, index_offset):
+	return [partial_data[0], partial_data[1] + index_offset]
+
+def shift_none(partial_data, index_offset):
+	return partial_data
+
+# Reduction names mapped to their partial, combine, finish, and shift. Top-k is built on demand in reduce_parse.
+REDUCE_OPS = {
+	"min": [partial_min, combine_min, finish_none, shift_none],
+	"max": [partial_max, combine_max, finish_none, shift_none],
+	"sum": [partial_sum, lambda temp_a, temp_b: temp_a + temp_b, finish_none, shift_none],
+	"count": [partial_count, lambda temp_a, temp_b: temp_a + temp_b, finish_none, shift_none],
+	"mean": [partial_mean, combine_mean, finish_mean, shift_none],
+	"argmin": [partial_argmin, combine_argmin, finish_index, shift_index],
+	"argmax": [partial_argmax, combine_argmax, finish_index, shift_index],
+}
+
+# Turn a comma separated list of reduction names into a list of [name, partial, combine, finish, shift].
+# Returns None if any name is invalid.
+def reduce_parse(reduce_str):
+	reduce_list = []
+	for temp_name in reduce_str.replace(" ", "").split(","):
+		if temp_name in REDUCE_OPS:
+			reduce_list.append([temp_name] + REDUCE_OPS[temp_name])
+		elif temp_name.startswith("top") and temp_name[3:].isdigit() and int(temp_name[3:]) > 0:
+			top_count = int(temp_name[3:])
+			reduce_list.append([temp_name, functools.partial(partial_top, top_count), functools.partial(combine_top, top_count), finish_none, shift_none])
+		else:
+			return None
+	return reduce_list
+
 #==================================================================================================================================
 
-# Get the max of an array of numbers.
-def max_get(input_nums):
-	sys.exit(max(input_nums))
+# Send an object through a pipe, prefixed by its length.
+def pipe_send(proc_pipe, pipe_object):
+	pipe_data = pickle.dumps(pipe_object)
+	os.write(proc_pipe, struct.pack("<Q", len(pipe_data)) + pipe_data)
+	return
+
+# Read exactly a number of bytes from a pipe. Returns None if the other end closed first.
+def pipe_read(proc_pipe, pipe_len):
+	pipe_data = b""
+	while len(pipe_data) < pipe_len:
+		pipe_chunk = os.read(proc_pipe, pipe_len - len(pipe_data))
+		if not pipe_chunk:
+			return None
+		pipe_data += pipe_chunk
+	return pipe_data
+
+# Receive an object sent with pipe_send. Blocks until it arrives, and returns None if the other end closed.
+def pipe_recv(proc_pipe):
+	pipe_len = pipe_read(proc_pipe, 8)
+	if pipe_len is None:
+		return None
+	return pickle.loads(pipe_read(proc_pipe, struct.unpack("<Q", pipe_len)[0]))
 
 #==================================================================================================================================
 
-# Setup the parent process.
-def parent_setup(child_count, input_nums):
-	proc_pids = []
-	for temp_window in array_split(input_nums, child_count):
-		proc_pid = os.fork()
-		if proc_pid == 0:
-			max_get(temp_window)
+# Fold one more block of numbers into a list of running partials. Empty blocks are skipped, and None means no partial yet.
+# Typed blocks are handed to NumPy if it is installed. Its view of the block is dropped on return, so the block can be released.
+def reduce_block(reduce_list, reduce_partials, block_nums, block_index):
+	if not len(block_nums):
+		return reduce_partials
+	if numpy is not None and isinstance(block_nums, memoryview):
+		block_nums = numpy.frombuffer(block_nums, dtype=block_nums.format)
+	block_partials = [temp_reduce[1](block_nums, block_index) for temp_reduce in reduce_list]
+	if reduce_partials is None:
+		return block_partials
+	return [temp_reduce[2](temp_a, temp_b) for temp_reduce, temp_a, temp_b in zip(reduce_list, reduce_partials, block_partials)]
+
+#==================================================================================================================================
+
+# Split a file into a byte range per child, keeping the edges on whole items for binary files.
+def file_split(file_size, array_count, item_size):
+	item_count = file_size // item_size
+	return [range(temp_range.start * item_size, temp_range.stop * item_size) for temp_range in array_split(item_count, array_count)]
+
+# Find the first delimiter at or after a position in a text file, or the end of the file.
+def file_delim(file_map, file_pos):
+	file_match = FILE_DELIM.search(file_map, file_pos)
+	return file_match.start() if file_match else len(file_map)
+
+# Stream through a byte range of a memory mapped file in blocks, and return the partials and how many numbers were seen.
+# Binary files are cast straight to typed views. In text files, a child owns every number that starts inside its range.
+def file_reduce(file_name, file_code, file_range, reduce_list):
+	file_handle = open(file_name, "rb")
+	file_map = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+	file_handle.close()
+	if hasattr(file_map, "madvise"):
+		file_map.madvise(mmap.MADV_SEQUENTIAL)
+	reduce_partials = None
+	num_count = 0
+	if file_code:
+		item_size = array.array(file_code).itemsize
+		with memoryview(file_map) as file_view:
+			for temp_start in range(file_range.start, file_range.stop, FILE_BLOCK - FILE_BLOCK % item_size):
+				temp_stop = min(file_range.stop, temp_start + FILE_BLOCK - FILE_BLOCK % item_size)
+				with file_view[temp_start:temp_stop].cast(file_code) as block_nums:
+					reduce_partials = reduce_block(reduce_list, reduce_partials, block_nums, range(num_count, num_count + len(block_nums)))
+					num_count += len(block_nums)
+	else:
+		# Skip a number cut off at the start, it belongs to the child before us. Finish the one cut off at the end.
+		file_pos = file_range.start
+		if file_pos > 0 and not FILE_DELIM.match(file_map, file_pos - 1):
+			file_pos = file_delim(file_map, file_pos)
+		file_end = file_range.stop
+		if file_end > 0 and not FILE_DELIM.match(file_map, file_end - 1):
+			file_end = file_delim(file_map, file_end)
+		while file_pos < file_end:
+			block_end = min(file_end, file_delim(file_map, min(file_end, file_pos + FILE_BLOCK)))
+			block_nums = [num_cast(temp_token) for temp_token in file_map[file_pos:block_end].replace(b",", b" ").split()]
+			reduce_partials = reduce_block(reduce_list, reduce_partials, block_nums, range(num_count, num_count + len(block_nums)))
+			num_count += len(block_nums)
+			file_pos = block_end + 1
+	file_map.close()
+	return [reduce_partials, num_count]
+
+#==================================================================================================================================
+
+# A pool worker. Sleeps on its job pipe, reduces the window it is sent, and sends the partials back on its result pipe.
+# Jobs are [job type, source, type code, range, reduction names], and None means shut down. The types are:
+# "mem" for an index range of the pool's memory, "list" for a list slice sent in the job, and "file" for a byte range of a file.
+# Results are [partials, number count], with indexes counted from the start of the job, or [None, -1] if a token in a file
+# isn't a number.
+def reduce_get(job_pipe, result_pipe):
+	mem_cache = None
+	while True:
+		job_data = pipe_recv(job_pipe)
+		if job_data is None:
+			break
+		job_type, job_source, job_code, job_range, reduce_names = job_data
+		reduce_list = reduce_parse(",".join(reduce_names))
+		if job_type == "file":
+			try:
+				pipe_send(result_pipe, file_reduce(job_source, job_code, job_range, reduce_list))
+			except ValueError:
+				pipe_send(result_pipe, [None, -1])
+		elif job_type == "list":
+			pipe_send(result_pipe, [reduce_block(reduce_list, None, job_source, range(len(job_source))), len(job_source)])
 		else:
-			proc_pids.append(proc_pid)
-	print("Process pids: " + str(proc_pids))
-	proc_results = []
-	while proc_pids:
-		proc_pid, proc_code = os.wait()
+			# Attach to the pool's memory by name, and keep it until the parent replaces it with a bigger one.
+			if mem_cache is None or mem_cache.name != job_source:
+				if mem_cache is not None:
+					mem_cache.close()
+				mem_cache = shared_memory.SharedMemory(name=job_source)
+			with mem_cache.buf.cast(job_code)[job_range.start:job_range.stop] as window_nums:
+				pipe_send(result_pipe, [reduce_block(reduce_list, None, window_nums, range(len(window_nums))), len(window_nums)])
+	# Skip the parent's exit handlers, the pool is done.
+	os._exit(0)
+
+#==================================================================================================================================
+
+# Fork the pool of workers, each with a job pipe and a result pipe.
+def pool_setup(child_count):
+	pool_data = {"pids": [], "jobs": [], "results": [], "mem": None}
+	# Share one resource tracker with the workers, otherwise each one would unlink the pool's memory when it exits.
+	resource_tracker.ensure_running()
+	for temp_itr in range(child_count):
+		job_read_end, job_write_end = os.pipe()
+		result_read_end, result_write_end = os.pipe()
+		proc_pid = os.fork()
 		if proc_pid == 0:
-			time.sleep(1)
+			# Drop the pipe ends of earlier workers, so they see end of file if the parent dies.
+			for temp_pipe in pool_data["jobs"] + pool_data["results"] + [job_write_end, result_read_end]:
+				os.close(temp_pipe)
+			reduce_get(job_read_end, result_write_end)
+		os.close(job_read_end)
+		os.close(result_write_end)
+		pool_data["pids"].append(proc_pid)
+		pool_data["jobs"].append(job_write_end)
+		pool_data["results"].append(result_read_end)
+	print("Process pids: " + str(pool_data["pids"]))
+	return pool_data
+
+# Tell every worker to stop, reap them, and clean up the shared memory.
+def pool_shutdown(pool_data):
+	for temp_pipe in pool_data["jobs"]:
+		# A worker that died has already closed its end.
+		try:
+			pipe_send(temp_pipe, None)
+		except BrokenPipeError:
+			pass
+		os.close(temp_pipe)
+	for temp_pid, temp_pipe in zip(pool_data["pids"], pool_data["results"]):
+		os.waitpid(temp_pid, 0)
+		os.close(temp_pipe)
+	if pool_data["mem"] is not None:
+		pool_data["mem"].close()
+		pool_data["mem"].unlink()
+	return
+
+#==================================================================================================================================
+
+# Send one job to each worker, skipping empty ranges, and combine what comes back in order.
+# Returns the result of every reduction in the reduce list, None if there were no numbers, or False if a worker failed or died.
+def pool_run(pool_data, job_list, reduce_list):
+	reduce_names = [temp_reduce[0] for temp_reduce in reduce_list]
+	proc_pipes = []
+	pool_failed = False
+	for temp_itr, temp_job in enumerate(job_list):
+		if not temp_job[3]:
+			continue
+		try:
+			pipe_send(pool_data["jobs"][temp_itr], temp_job + [reduce_names])
+		except BrokenPipeError:
+			pool_failed = True
+			continue
+		proc_pipes.append(pool_data["results"][temp_itr])
+	proc_results = [pipe_recv(temp_pipe) for temp_pipe in proc_pipes]
+	if pool_failed or any(temp_result is None or temp_result[1] < 0 for temp_result in proc_results):
+		return False
+	# Shift each job's indexes by how many numbers came before it, then combine the partials of each reduction.
+	reduce_partials = None
+	num_count = 0
+	for job_partials, job_count in proc_results:
+		if job_partials is not None:
+			job_partials = [temp_reduce[4](temp_partial, num_count) for temp_reduce, temp_partial in zip(reduce_list, job_partials)]
+			if reduce_partials is None:
+				reduce_partials = job_partials
+			else:
+				reduce_partials = [temp_reduce[2](temp_a, temp_b) for temp_reduce, temp_a, temp_b in zip(reduce_list, reduce_partials, job_partials)]
+		num_count += job_count
+	if reduce_partials is None:
+		return None
+	return [temp_reduce[3](temp_partial) for temp_reduce, temp_partial in zip(reduce_list, reduce_partials)]
+
+# Run a query on the pool over an array of numbers.
+def parent_setup(pool_data, input_nums, reduce_list):
+	array_code = array_share(pool_data, input_nums)
+	# Workers only look at their own block of the shared array, nothing is copied.
+	job_list = []
+	for temp_window in array_split(len(input_nums), len(pool_data["pids"])):
+		if array_code:
+			job_list.append(["mem", pool_data["mem"].name, array_code, temp_window])
 		else:
-			proc_results.append(proc_code//256)
-			proc_pids.remove(proc_pid)
-	return max(proc_results)
+			job_list.append(["list", input_nums[temp_window.start:temp_window.stop], None, temp_window])
+	return pool_run(pool_data, job_list, reduce_list)
+
+# Run a query on the pool over a file. Files ending in .i64 or .f64 are raw 64 bit ints or floats, anything else is text.
+def file_setup(pool_data, file_name, reduce_list):
+	file_code = FILE_CODES.get(os.path.splitext(file_name)[1])
+	item_size = array.array(file_code).itemsize if file_code else 1
+	job_list = []
+	for temp_range in file_split(os.path.getsize(file_name), len(pool_data["pids"]), item_size):
+		job_list.append(["file", file_name, file_code, temp_range])
+	return pool_run(pool_data, job_list, reduce_list)
 
 #==================================================================================================================================
 
 if __name__ == "__main__":
 	child_count = 1
+	reduce_list = reduce_parse("max")
 	if len(sys.argv) > 1:
 		try:
 			int(sys.argv[1])
 		except:
 			print("Error: Child count is not a number.")
 			exit()
-		if int(sys.argv[1]) < 0:
-			print("Error: Child count cannot be less than 0.")
+		if int(sys.argv[1]) < 1:
+			print("Error: Child count cannot be less than 1.")
 			exit()
 		child_count = int(sys.argv[1])
-	input_nums = array_get(False)
-	if child_count > len(input_nums):
-		print("Error: More chilren than numbers in list.")
+	if len(sys.argv) > 2:
+		reduce_list = reduce_parse(sys.argv[2])
+		if not reduce_list:
+			print("Error: Reductions must be a comma separated list of: " + ", ".join(REDUCE_OPS) + ", or topK.")
+			exit()
+	# Reduce a file instead of asking for arrays if one was given.
+	if len(sys.argv) > 3:
+		if not os.path.isfile(sys.argv[3]):
+			print("Error: The input file doesn't exist.")
+			exit()
+		pool_data = pool_setup(child_count)
+		reduce_results = file_setup(pool_data, sys.argv[3], reduce_list)
+		pool_shutdown(pool_data)
+		if reduce_results is False:
+			print("Error: The input file has something in it that isn't a number.")
+			exit()
+		if reduce_results is None:
+			print("Error: The input file has no numbers in it.")
+			exit()
+		for temp_reduce, temp_result in zip(reduce_list, reduce_results):
+			print("The " + temp_reduce[0] + " of the file is: " + str(temp_result))
 		exit()
-	random.shuffle(input_nums)
-	print("Shuffled array of numbers: " + str(input_nums))
-	array_max = parent_setup(child_count, input_nums)
-	print("The max of the array is: " + str(array_max))
+	# Keep answering queries on the same pool until an empty array is given.
+	pool_data = pool_setup(child_count)
+	while True:
+		input_nums = array_get(False)
+		if not input_nums:
+			break
+		random.shuffle(input_nums)
+		print("Shuffled array of numbers: " + str(input_nums))
+		reduce_results = parent_setup(pool_data, input_nums, reduce_list)
+		if reduce_results is False:
+			print("Error: A child died before it could reduce its numbers.")
+			break
+		for temp_reduce, temp_result in zip(reduce_list, reduce_results):
+			print("The " + temp_reduce[0] + " of the array is: " + str(temp_result))
+	pool_shutdown(pool_data)
 	exit()
 	
 #==================================================================================================================================
\ No newline at end of file
@@ -1,20 +1,97 @@
 #==================================================================================================================================
 # sort.py - Copyright Vess 2023
 # Proof of concept for a shared memory mergesort client. Child processes sort and merge chunks.
+# Records are read and written through a view of the shared memory a chunk at a time. Ints and floats get a typed view. Pairs
+# and fixed length byte strings are stored as byte strings whose byte order is their sort order, so they sort as plain bytes.
+# Merges only touch the part of the runs that overlap, and skip runs that are already in order.
+# Work is handed out and handed back through blocking queues in shared memory, so idle processes sleep instead of spinning.
+# The workers are a pool that can be kept warm and reused, which parallel_sort does for callers that import this file.
+# Pool children keep a heartbeat and progress counters in shared memory. The dispatcher reaps any child that dies, hands its
+# chunks back out, and forks a new child in its place, so a killed child costs a little time instead of a stuck sort.
+# A bench mode times every phase over a sweep of sizes, child counts, and distributions against a plain sorted() call.
+# Tracing can be turned on to record every phase of every process into shared memory, and export it as a Chrome trace.
+# A sample sort mode splits the records into one bucket per child instead, so every child works until the very end.
+# An external sort mode sorts inputs bigger than memory, by sorting runs of the file to disk then streaming a merge of them.
+# Text input is parsed and the sorted text is written by every child at once. Binary .i64 and .f64 files skip parsing entirely.
 #==================================================================================================================================
 # Known Bugs, Issues, and Limitations
-# 1. There is a max of 251 child processes due to how flag codes work.
-# 2. An incredibly small race condition with dispatches from the server is theoretically possible?
+# 1. Ints, and the keys and payloads of pairs, must fit in a signed 64 bit int. Byte strings must fit in their length.
+# 2. Sample sort buckets can be uneven when the input is full of duplicate records, since equal records share a bucket.
+# 3. The external sort's final merge runs on the server alone, so it is bound by one core.
+# 4. NaN floats have no order, so they leave the floats around them unsorted.
+# 5. Pairs and byte strings can only be read from and written to text files.
+# 6. Trace events past the size of the trace buffer are dropped.
+# 7. Only the pool recovers from a dead child. A child that dies in a sample or external sort, or while holding a queue's lock,
+#    or part way through writing its records back, still hangs or spoils the sort.
 #==================================================================================================================================
 
 # Imports.
+import array
+import atexit
+import bisect
+import csv
+import heapq
+import json
 import math
+import mmap
+import multiprocessing
+from multiprocessing import resource_tracker
 from multiprocessing import shared_memory
 import os
 import random
+import re
+import struct
 import sys
+import tempfile
 import time
 
+# Constants.
+SORT_MODES = ["merge", "sample", "external"]
+SAMPLE_RATE = 32
+QUEUE_HEADER = struct.Struct("<QQ")
+QUEUE_JOB = struct.Struct("<qq")
+JOB_KILL = -1
+JOB_FAIL = -2
+JOB_WAIT = -3
+CHUNK_MIN = 100
+CHUNK_ITEM = 40
+CHUNK_SPREAD = 4
+CACHE_DEFAULT = 262144
+CACHE_PATH = "/sys/devices/system/cpu/cpu0/cache/index2/size"
+FILE_DELIM = re.compile(rb"\s")
+RUN_MIN = 1048576
+RUN_FACTOR = 16
+MEMORY_DEFAULT = 1073741824
+MERGE_BLOCK = 65536
+MERGE_FAN = 64
+FLAG_UNSORTED = 0
+FLAG_WORKING = 1
+FLAG_HEAD = 2
+FLAG_BODY = 3
+FLAG_NAMES = ["unsorted", "working", "head", "body"]
+FLAG_NOBODY = 0xFFFFFFFF
+FLAG_RECORD = 10
+PAIR_BIAS = 1 << 63
+FLOAT_EXACT = 1 << 53
+POOL_CONTEXT = struct.Struct("<qqq32s32s16s")
+POOL_JOBS = 65536
+BEAT_RECORD = struct.Struct("<qqqqqq")
+BEAT_WAIT = 1.0
+BEAT_STALL = 60
+MEM_PREFIX = "sort_"
+BENCH_DISTS = ["uniform", "sorted", "reversed", "duplicates", "zipf"]
+BENCH_MODES = ["merge", "sample"]
+BENCH_MIN = 1000
+BENCH_MAX = 1000000
+BENCH_REPEAT = 3
+BENCH_ZIPF = 1.2
+BENCH_RANKS = 65536
+BENCH_PHASES = ["dispatch", "wait", "idle", "sort", "merge", "write"]
+TRACE_HEADER = struct.Struct("<Q")
+TRACE_EVENT = struct.Struct("<qqiiq")
+TRACE_EVENTS = 262144
+TRACE_NAMES = ["load", "read", "parse", "write", "dispatch", "wait", "idle", "sort", "merge", "dump", "format", "respawn"]
+
 #==================================================================================================================================
 
 # Clear the terminal output.
@@ -24,6 +101,12 @@ def client_clear():
 
 #==================================================================================================================================
 
+# Make a shared memory name that no other sort on this host is using, for memory that children attach to before it exists.
+def mem_unique():
+	return MEM_PREFIX + str(os.getpid()) + "_" + os.urandom(4).hex()
+
+#==================================================================================================================================
+
 # Debug function to create a input file of random numbers.
 def file_debug(file_name, num_min, num_max, num_range):
 	file_handle = open(file_name, "w")
@@ -34,99 +117,521 @@ def file_debug(file_name, num_min, num_max, num_range):
 	
 #==================================================================================================================================
 
-# Read and cast in an input file of numbers delimited by spaces.
-def file_read(file_name):
-	file_handle = open(file_name, "r")
-	file_data = file_handle.read()
-	file_data = file_data.split(" ")
-	# Remove last space item if one exists from debug file.
-	if "" in file_data:
-		file_data.remove("")
-	# Split by space and cast to integers.
-	file_list = list(map(int, file_data))
-	server_status("Read in " + str(len(file_list)) + " numbers from " + file_name)
-	return file_list
+# Turn a pair token of "key:payload" into a 16 byte record, with both halves biased to unsigned and stored big endian so the
+# bytes sort by key, then by payload.
+def pair_parse(pair_token):
+	pair_key, pair_payload = pair_token.split(b":")
+	return (int(pair_key) + PAIR_BIAS).to_bytes(8, "big") + (int(pair_payload) + PAIR_BIAS).to_bytes(8, "big")
+
+# Turn a 16 byte pair record back into a "key:payload" token.
+def pair_format(pair_record):
+	return str(int.from_bytes(pair_record[:8], "big") - PAIR_BIAS) + ":" + str(int.from_bytes(pair_record[8:], "big") - PAIR_BIAS)
+
+# Turn a byte string token into a fixed length record, padded with zero bytes so shorter strings sort first.
+def text_parse(text_token, text_size):
+	if len(text_token) > text_size:
+		raise OverflowError("Byte string is longer than its record")
+	return text_token.ljust(text_size, b"\0")
+
+# Turn a fixed length byte string record back into a token.
+def text_format(text_record):
+	return text_record.rstrip(b"\0").decode("latin-1")
+
+#==================================================================================================================================
+
+# Find a record type by name. Every record type is its name, width in bytes, typecode for a typed view or None for byte
+# strings, token parser, token formatter, and binary file extension or None. Returns None if there's no such type.
+def record_parse(record_name):
+	if record_name == "int":
+		return ["int", 8, "q", int, str, ".i64"]
+	elif record_name == "float":
+		return ["float", 8, "d", float, repr, ".f64"]
+	elif record_name == "pair":
+		return ["pair", 16, None, pair_parse, pair_format, None]
+	elif record_name.startswith("bytes") and record_name[5:].isdigit() and int(record_name[5:]) > 0:
+		text_size = int(record_name[5:])
+		return [record_name, text_size, None, lambda temp_token: text_parse(temp_token, text_size), text_format, None]
+	return None
+
+#==================================================================================================================================
+
+# Find how many view items make up a record. A typed view has one item per record, and a byte view has one per byte.
+def rec_step(rec_type):
+	return 1 if rec_type[2] else rec_type[1]
+
+#==================================================================================================================================
+
+# Return a view of a shared memory buffer for a record type.
+def rec_view(mem_buf, rec_type):
+	return mem_buf.cast(rec_type[2] if rec_type[2] else "B")
+
+#==================================================================================================================================
+
+# Return how many records are in a view or a packed block of records.
+def rec_len(rec_data, rec_type):
+	return len(rec_data) // rec_step(rec_type)
+
+#==================================================================================================================================
+
+# Pack a list of records into one block to write to a view. Returns None if a record can't be parsed or doesn't fit its type.
+def rec_pack(rec_list, rec_type):
+	try:
+		if rec_type[2]:
+			return array.array(rec_type[2], rec_list)
+		return b"".join(rec_list)
+	except (OverflowError, ValueError):
+		return None
 
 #==================================================================================================================================
 
-# Find the byte length of the number.
-def byte_len(num_input):
-	return math.ceil(num_input.bit_length() / 8.0)
+# Read the records from a start to an end index as a list, in one bulk copy.
+def rec_read(rec_view, rec_type, rec_start, rec_end):
+	if rec_type[2]:
+		return rec_view[rec_start:rec_end].tolist()
+	rec_bytes = rec_view[rec_start*rec_type[1]:rec_end*rec_type[1]].tobytes()
+	return [rec_bytes[temp_pos:temp_pos+rec_type[1]] for temp_pos in range(0, len(rec_bytes), rec_type[1])]
+
+#==================================================================================================================================
+
+# Write a packed block of records starting at an index, in one bulk copy.
+def rec_write(rec_view, rec_type, rec_start, rec_data):
+	rec_pos = rec_start * rec_step(rec_type)
+	rec_view[rec_pos:rec_pos+len(rec_data)] = rec_data
+	return
 
 #==================================================================================================================================
 
-# Cast a list of integers to a list of bytes after finding the max.
-def byte_cast(num_list):
-	byte_list = []
-	# Find the max required number of bytes.
-	byte_size = 0
-	for temp_num in num_list:
-		byte_count = byte_len(temp_num)
-		if byte_count > byte_size:
-			byte_size= byte_count
-	# Convert the numbers to signed big endian bytes.
-	for temp_num in num_list:
-		byte_new = temp_num.to_bytes(byte_size, "big", signed=True)
-		byte_list.append(byte_new)
-	return byte_list, byte_size
+# Return a single record.
+def rec_at(rec_view, rec_type, rec_index):
+	if rec_type[2]:
+		return rec_view[rec_index]
+	return rec_view[rec_index*rec_type[1]:(rec_index+1)*rec_type[1]].tobytes()
 
 #==================================================================================================================================
 
-# Cast a single list of bytes to an integer.
-def num_cast(byte_list):
-	return int.from_bytes(byte_list, "big", signed=True)
+# Setup shared memory for a control record per chunk, or reuse the pool's if it is big enough. Every chunk has a 16 bit state,
+# a 32 bit owner, and a 32 bit generation that goes up every time the chunk is handed to a child. They are stored as three
+# arrays, owners and generations first so every array stays aligned.
+def flag_setup(pool_data, chunk_count):
+	if pool_data["flag"] is None or pool_data["flag"].size < chunk_count * FLAG_RECORD:
+		if pool_data["flag"] is not None:
+			pool_data["flag"].close()
+			pool_data["flag"].unlink()
+		pool_data["flag"] = shared_memory.SharedMemory(create=True, size=chunk_count * FLAG_RECORD)
+	flag_views = flag_view(pool_data["flag"], chunk_count)
+	flag_views[0][:] = array.array("H", [FLAG_UNSORTED]) * chunk_count
+	flag_views[1][:] = array.array("I", [FLAG_NOBODY]) * chunk_count
+	for temp_view in flag_views:
+		temp_view.release()
+	return pool_data["flag"]
 
 #==================================================================================================================================
 
-# Simply return the memory flag buffer as a list string.
-def flag_status(mem_flag):
-	return list(mem_flag.buf)
+# Return typed views of the states, owners, and generations of every chunk.
+def flag_view(mem_flag, chunk_count):
+	flag_states = mem_flag.buf[chunk_count*8:chunk_count*10].cast("H")
+	flag_owners = mem_flag.buf[0:chunk_count*4].cast("I")
+	flag_generations = mem_flag.buf[chunk_count*4:chunk_count*8].cast("I")
+	return [flag_states, flag_owners, flag_generations]
 
 #==================================================================================================================================
 
-# Read memory byte data from a specific chunk number or range as integers.
-def mem_read(mem_target, chunk_index, byte_size):
-	# Find the appropriate start and end indexes for the chunk number.
-	mem_start = chunk_index * (100 * byte_size)
-	mem_end = mem_start + (100 * byte_size)
-	mem_max = len(mem_target.buf)
-	if mem_end > mem_max:
-		mem_end = mem_max
-	# Convert our chunk bytes to a list of integers.
-	num_cache = []
-	for temp_index in range(mem_start, mem_end, byte_size):
-		num_int = num_cast(mem_target.buf[temp_index:temp_index+byte_size])
-		num_cache.append(num_int)
-	return num_cache
+# Mark a range of chunks as being worked on by a child, and move them all to one generation newer than any of them had.
+# Returns the generation, which tells this claim apart from any earlier one on the same chunks.
+def flag_claim(flag_views, chunk_first, chunk_last, child_id):
+	flag_states, flag_owners, flag_generations = flag_views
+	chunk_count = chunk_last - chunk_first + 1
+	flag_gen = (max(flag_generations[chunk_first:chunk_last+1]) + 1) & 0xFFFFFFFF
+	flag_generations[chunk_first:chunk_last+1] = array.array("I", [flag_gen]) * chunk_count
+	flag_owners[chunk_first:chunk_last+1] = array.array("I", [child_id]) * chunk_count
+	flag_states[chunk_first:chunk_last+1] = array.array("H", [FLAG_WORKING]) * chunk_count
+	return flag_gen
 
 #==================================================================================================================================
 
-# Write memory byte data to a target memory at a certain chunk number.
-def mem_write(mem_target, chunk_index, chunk_data, byte_size):
-	mem_start = chunk_index * (100 * byte_size)
-	mem_end = mem_start + (len(chunk_data) * byte_size)
-	for temp_pair in zip(range(mem_start, mem_end, byte_size), chunk_data):
-		mem_target.buf[temp_pair[0]:temp_pair[0]+byte_size] = temp_pair[1]
+# Mark a range of chunks as one sorted run with nobody working on it.
+def flag_finish(flag_views, chunk_first, chunk_last):
+	flag_states, flag_owners, flag_generations = flag_views
+	chunk_count = chunk_last - chunk_first + 1
+	flag_owners[chunk_first:chunk_last+1] = array.array("I", [FLAG_NOBODY]) * chunk_count
+	flag_states[chunk_first:chunk_last+1] = array.array("H", [FLAG_HEAD] + [FLAG_BODY] * (chunk_count - 1))
 	return
 
 #==================================================================================================================================
 
-def mem_dump(mem_target, byte_size):
-	num_cache = []
-	for temp_index in range(0, len(mem_target.buf), byte_size):
-		num_int = num_cast(mem_target.buf[temp_index:temp_index+byte_size])
-		num_cache.append(num_int)
-	print(num_cache)
+# Check if a range of chunks is one finished run, with a head, every other chunk its body, and nobody working on it.
+def flag_done(flag_views, chunk_first, chunk_last):
+	flag_states, flag_owners, flag_generations = flag_views
+	if flag_states[chunk_first] != FLAG_HEAD or flag_owners[chunk_first] != FLAG_NOBODY:
+		return False
+	return flag_states[chunk_first+1:chunk_last+1].tolist().count(FLAG_BODY) == chunk_last - chunk_first
+
+#==================================================================================================================================
+
+#==================================================================================================================================
+
+# Hand a range of chunks a dead child was working on back to nobody. A single chunk goes back to unsorted, and every chunk
+# of a merge is a sorted run of its own until the merge is done again.
+def flag_orphan(flag_views, chunk_first, chunk_last):
+	flag_states, flag_owners, flag_generations = flag_views
+	chunk_count = chunk_last - chunk_first + 1
+	flag_owners[chunk_first:chunk_last+1] = array.array("I", [FLAG_NOBODY]) * chunk_count
+	flag_states[chunk_first:chunk_last+1] = array.array("H", [FLAG_UNSORTED if chunk_count == 1 else FLAG_HEAD]) * chunk_count
 	return
 
 #==================================================================================================================================
 
-# Sort and return a list of numbers.
+# Simply return how many chunks are in each state.
+def flag_status(mem_flag, chunk_count):
+	flag_states, flag_owners, flag_generations = flag_view(mem_flag, chunk_count)
+	flag_list = flag_states.tolist()
+	for temp_view in [flag_states, flag_owners, flag_generations]:
+		temp_view.release()
+	return {temp_name: flag_list.count(temp_state) for temp_state, temp_name in enumerate(FLAG_NAMES)}
+
+#==================================================================================================================================
+
+# Find the size of the L2 cache in bytes, from sysconf or sysfs, or a safe guess if neither knows.
+def cache_size():
+	try:
+		cache_bytes = os.sysconf("SC_LEVEL2_CACHE_SIZE")
+		if cache_bytes > 0:
+			return cache_bytes
+	except (ValueError, OSError):
+		pass
+	try:
+		cache_file = open(CACHE_PATH, "r")
+		cache_text = cache_file.read().strip().upper()
+		cache_file.close()
+		cache_scale = {"K": 1024, "M": 1048576}.get(cache_text[-1:], 1)
+		return int(cache_text.rstrip("KM")) * cache_scale
+	except (OSError, ValueError):
+		pass
+	return CACHE_DEFAULT
+
+#==================================================================================================================================
+
+# Pick a chunk size big enough that dispatches are cheap next to the sorting, but small enough that a chunk's numbers fit in
+# the L2 cache once they are Python ints, and that every child still gets a few chunks to sort.
+def chunk_auto(num_count, child_count, cache_bytes):
+	chunk_cache = cache_bytes // CHUNK_ITEM
+	chunk_spread = num_count // (child_count * CHUNK_SPREAD)
+	return max(CHUNK_MIN, min(chunk_cache, chunk_spread))
+
+#==================================================================================================================================
+
+# Find the start and end indexes of a range of chunks, cut off at the end of the records.
+def chunk_bounds(rec_view, rec_type, chunk_size, chunk_first, chunk_last):
+	return chunk_first * chunk_size, min((chunk_last + 1) * chunk_size, rec_len(rec_view, rec_type))
+
+#==================================================================================================================================
+
+# Read the records in a range of chunks as a list, in one bulk copy.
+def mem_read(rec_view, rec_type, chunk_size, chunk_first, chunk_last):
+	mem_start, mem_end = chunk_bounds(rec_view, rec_type, chunk_size, chunk_first, chunk_last)
+	return rec_read(rec_view, rec_type, mem_start, mem_end)
+
+#==================================================================================================================================
+
+# Write a packed block of records to the shared memory, starting at a chunk, in one bulk copy.
+def mem_write(rec_view, rec_type, chunk_size, chunk_index, chunk_data):
+	rec_write(rec_view, rec_type, chunk_index * chunk_size, chunk_data)
+	return
+
+#==================================================================================================================================
+
+# Sort and return a list of records.
 def num_sort(num_list):
 	return sorted(num_list)
 
 #==================================================================================================================================
 
+# Find where the sorted runs in a range of chunks start. A run can only start on a chunk edge, and only matters if the
+# record before it is bigger, since back to back runs that are already in order are just one longer run.
+def run_find(rec_view, rec_type, chunk_size, chunk_first, chunk_last):
+	run_starts = []
+	for temp_chunk in range(chunk_first + 1, chunk_last + 1):
+		temp_start, _ = chunk_bounds(rec_view, rec_type, chunk_size, temp_chunk, temp_chunk)
+		if rec_at(rec_view, rec_type, temp_start - 1) > rec_at(rec_view, rec_type, temp_start):
+			run_starts.append(temp_start)
+	return run_starts
+
+# Merge back to back sorted runs in place. Returns how many records had to be moved.
+# Records at the front of the first run that are below every later run, and at the back of the last run that are above
+# every earlier run, are already where they belong. Only the overlap between them is read, merged, and written back.
+def num_merge(rec_view, rec_type, mem_start, mem_end, run_starts):
+	if not run_starts:
+		return 0
+	rec_key = lambda temp_index: rec_at(rec_view, rec_type, temp_index)
+	rec_indexes = range(rec_len(rec_view, rec_type))
+	merge_start = bisect.bisect_right(rec_indexes, min(rec_key(temp_start) for temp_start in run_starts), mem_start, run_starts[0], key=rec_key)
+	merge_end = bisect.bisect_left(rec_indexes, max(rec_key(temp_start - 1) for temp_start in run_starts), run_starts[-1], mem_end, key=rec_key)
+	# The list sort finds the runs on its own and merges them in linear time, much faster than merging them in Python.
+	merge_data = rec_read(rec_view, rec_type, merge_start, merge_end)
+	merge_data.sort()
+	rec_write(rec_view, rec_type, merge_start, rec_pack(merge_data, rec_type))
+	return merge_end - merge_start
+
+#==================================================================================================================================
+
+# Find the start and end indexes of the contiguous block of records a child owns in a sample sort.
+def block_bounds(num_count, child_count, child_id):
+	return (child_id * num_count) // child_count, ((child_id + 1) * num_count) // child_count
+
+#==================================================================================================================================
+
+# Pick the records that split the input into one bucket per child, from a sorted random sample of the input.
+def sample_split(rec_view, rec_type, child_count):
+	num_count = rec_len(rec_view, rec_type)
+	sample_data = sorted(rec_at(rec_view, rec_type, temp_index) for temp_index in random.sample(range(num_count), min(num_count, child_count * SAMPLE_RATE)))
+	return [sample_data[(temp_bucket * len(sample_data)) // child_count] for temp_bucket in range(1, child_count)]
+
+#==================================================================================================================================
+
+# Setup a queue of jobs in shared memory. Every job is a first and last chunk. Getting blocks until there is a job, and
+# putting blocks until there is room, so nobody has to spin.
+def queue_setup(mem_name, job_count):
+	mem_queue = shared_memory.SharedMemory(create=True, size=QUEUE_HEADER.size + job_count * QUEUE_JOB.size)
+	QUEUE_HEADER.pack_into(mem_queue.buf, 0, 0, 0)
+	server_status("Shared memory setup for the " + mem_name + " queue with size " + str(mem_queue.size))
+	return [mem_queue, job_count, multiprocessing.Lock(), multiprocessing.Semaphore(0), multiprocessing.Semaphore(job_count)]
+
+#==================================================================================================================================
+
+# Put a job at the back of a queue, waiting for room if it is full. A child handing back a job clears it from its heartbeat
+# under the same lock, so the job is never both finished and held.
+def queue_put(queue_data, chunk_first, chunk_last, beat_data=None):
+	mem_queue, job_count, queue_lock, queue_jobs, queue_room = queue_data
+	queue_room.acquire()
+	with queue_lock:
+		queue_head, queue_tail = QUEUE_HEADER.unpack_from(mem_queue.buf, 0)
+		QUEUE_JOB.pack_into(mem_queue.buf, QUEUE_HEADER.size + (queue_tail % job_count) * QUEUE_JOB.size, chunk_first, chunk_last)
+		if beat_data is not None:
+			beat_mark(beat_data, JOB_KILL, JOB_KILL, 0, 1)
+		QUEUE_HEADER.pack_into(mem_queue.buf, 0, queue_head, queue_tail + 1)
+	queue_jobs.release()
+	return
+
+#==================================================================================================================================
+
+# Take the job at the front of a queue, waiting for one if it is empty, or returns JOB_WAIT if none comes in time. A child
+# taking a job records it in its heartbeat under the same lock, so the job is never held without the server knowing.
+def queue_get(queue_data, beat_data=None, queue_wait=None):
+	mem_queue, job_count, queue_lock, queue_jobs, queue_room = queue_data
+	if not queue_jobs.acquire(timeout=queue_wait):
+		return JOB_WAIT, JOB_WAIT
+	with queue_lock:
+		queue_head, queue_tail = QUEUE_HEADER.unpack_from(mem_queue.buf, 0)
+		chunk_first, chunk_last = QUEUE_JOB.unpack_from(mem_queue.buf, QUEUE_HEADER.size + (queue_head % job_count) * QUEUE_JOB.size)
+		if beat_data is not None:
+			beat_mark(beat_data, chunk_first, chunk_last, 0)
+		QUEUE_HEADER.pack_into(mem_queue.buf, 0, queue_head + 1, queue_tail)
+	queue_room.release()
+	return chunk_first, chunk_last
+
+#==================================================================================================================================
+
+# Setup shared memory for a heartbeat per child. Every child records when it was last heard from, the job it holds, the
+# generation it claimed the job's chunks with (0 until it has), and how many jobs and records it has finished.
+def beat_setup(child_count):
+	mem_beat = shared_memory.SharedMemory(create=True, size=child_count * BEAT_RECORD.size)
+	for temp_id in range(child_count):
+		BEAT_RECORD.pack_into(mem_beat.buf, temp_id * BEAT_RECORD.size, time.monotonic_ns(), JOB_KILL, JOB_KILL, 0, 0, 0)
+	server_status("Shared memory setup for heartbeats with size " + str(mem_beat.size))
+	return mem_beat
+
+#==================================================================================================================================
+
+# Beat a child's heart, recording the job it holds and its generation, and adding to its finished jobs and records.
+def beat_mark(beat_data, chunk_first, chunk_last, beat_gen, beat_jobs=0, beat_records=0):
+	mem_beat, child_id = beat_data
+	_, _, _, _, temp_jobs, temp_records = BEAT_RECORD.unpack_from(mem_beat.buf, child_id * BEAT_RECORD.size)
+	BEAT_RECORD.pack_into(mem_beat.buf, child_id * BEAT_RECORD.size, time.monotonic_ns(), chunk_first, chunk_last, beat_gen, temp_jobs + beat_jobs, temp_records + beat_records)
+	return
+
+#==================================================================================================================================
+
+# Simply return the seconds since every child was last heard from, its job, and its finished jobs and records as a list.
+def beat_status(mem_beat, child_count):
+	beat_now = time.monotonic_ns()
+	beat_list = []
+	for temp_id in range(child_count):
+		beat_time, chunk_first, chunk_last, beat_gen, beat_jobs, beat_records = BEAT_RECORD.unpack_from(mem_beat.buf, temp_id * BEAT_RECORD.size)
+		beat_list.append([round((beat_now - beat_time) / 1e9, 3), [chunk_first, chunk_last] if chunk_first >= 0 else None, beat_jobs, beat_records])
+	return beat_list
+
+#==================================================================================================================================
+
+# Setup a pool of children that wait for sort and merge jobs, with queues that hold up to a number of chunks. The memory for
+# records and flags is made by each sort, and kept in the pool to be reused by the next one.
+def pool_setup(child_count, job_count):
+	pool_data = {"pids": [], "share": None, "flag": None, "owner": os.getpid()}
+	pool_data["beat"] = beat_setup(child_count)
+	pool_data["work"] = queue_setup("work", job_count + child_count)
+	pool_data["done"] = queue_setup("done", job_count)
+	pool_data["context"] = shared_memory.SharedMemory(create=True, size=POOL_CONTEXT.size)
+	pool_data["jobs"] = job_count
+	# Share one resource tracker with the children, otherwise each one would unlink the pool's memory when it exits.
+	resource_tracker.ensure_running()
+	for temp_id in range(child_count):
+		proc_pid = os.fork()
+		if proc_pid == 0:
+			child_start(temp_id, pool_data)
+		pool_data["pids"].append(proc_pid)
+		server_status("Created child with ID " + str(temp_id))
+	return pool_data
+
+#==================================================================================================================================
+
+# Tell every child in a pool to stop, reap them, and clean up the pool's memory.
+def pool_shutdown(pool_data):
+	for temp_pid in pool_data["pids"]:
+		queue_put(pool_data["work"], JOB_KILL, JOB_KILL)
+	for temp_pid in pool_data["pids"]:
+		os.waitpid(temp_pid, 0)
+	server_shutdown([temp_mem for temp_mem in [pool_data["share"], pool_data["flag"]] if temp_mem is not None])
+	server_shutdown([pool_data["work"][0], pool_data["done"][0], pool_data["context"], pool_data["beat"]])
+	return
+
+#==================================================================================================================================
+
+# Reap every child in a pool that has died, and fork a new child with its ID. The chunks a dead child held are checked in the
+# flags. If it finished them but died before handing them back, they are handed back for it. If its claim on them is still
+# current, they go back to nobody. Returns the jobs to queue again, and the jobs to count as done.
+def pool_reap(pool_data, chunk_count):
+	reap_jobs = []
+	reap_done = []
+	for temp_id, temp_pid in enumerate(pool_data["pids"]):
+		reap_pid, reap_status = os.waitpid(temp_pid, os.WNOHANG)
+		if reap_pid == 0:
+			continue
+		trace_begin = trace_start()
+		beat_time, chunk_first, chunk_last, beat_gen, beat_jobs, beat_records = BEAT_RECORD.unpack_from(pool_data["beat"].buf, temp_id * BEAT_RECORD.size)
+		if chunk_first >= 0:
+			flag_views = flag_view(pool_data["flag"], chunk_count)
+			flag_states, flag_owners, flag_generations = flag_views
+			if beat_gen and flag_done(flag_views, chunk_first, chunk_last):
+				reap_done.append([chunk_first, chunk_last])
+			else:
+				# A claim that never made it into the heartbeat is still ours if we own the chunks in a newer generation.
+				if flag_states[chunk_first] == FLAG_WORKING and flag_owners[chunk_first] == temp_id and flag_generations[chunk_first] >= beat_gen:
+					flag_orphan(flag_views, chunk_first, chunk_last)
+				reap_jobs.append([chunk_first, chunk_last])
+			for temp_view in flag_views:
+				temp_view.release()
+		BEAT_RECORD.pack_into(pool_data["beat"].buf, temp_id * BEAT_RECORD.size, time.monotonic_ns(), JOB_KILL, JOB_KILL, 0, beat_jobs, beat_records)
+		proc_pid = os.fork()
+		if proc_pid == 0:
+			child_start(temp_id, pool_data)
+		pool_data["pids"][temp_id] = proc_pid
+		trace_end("respawn", trace_begin, temp_id)
+		reap_held = "chunks " + str(chunk_first) + " to " + str(chunk_last) if chunk_first >= 0 else "no chunks"
+		server_status("Child with ID " + str(temp_id) + " died with status " + str(os.waitstatus_to_exitcode(reap_status)) + " holding " + reap_held + " after " + str(beat_jobs) + " jobs, respawned it")
+	return reap_jobs, reap_done
+
+#==================================================================================================================================
+
+# Make sure the pool's memory for records can hold a number of bytes, replacing it with a bigger one if it can't.
+def pool_share(pool_data, mem_size):
+	if pool_data["share"] is None or pool_data["share"].size < mem_size:
+		if pool_data["share"] is not None:
+			pool_data["share"].close()
+			pool_data["share"].unlink()
+		pool_data["share"] = shared_memory.SharedMemory(create=True, size=max(4096, mem_size * 2))
+	return pool_data["share"]
+
+#==================================================================================================================================
+
+# Sort the records at the front of the pool's memory, and return once they are sorted.
+def pool_sort(pool_data, rec_count, rec_type, chunk_size):
+	chunk_count = math.ceil(rec_count / chunk_size)
+	mem_flag = flag_setup(pool_data, chunk_count)
+	server_status("Shared memory setup for flags with size " + str(mem_flag.size))
+	POOL_CONTEXT.pack_into(pool_data["context"].buf, 0, chunk_size, chunk_count, rec_count, pool_data["share"].name.encode(), mem_flag.name.encode(), rec_type[0].encode())
+	server_start(pool_data, chunk_count)
+	return
+
+#==================================================================================================================================
+
+# Turn on tracing, with a buffer of events in shared memory that every process forked afterwards writes into.
+def trace_setup():
+	global trace_data
+	mem_trace = shared_memory.SharedMemory(create=True, size=TRACE_HEADER.size + TRACE_EVENTS * TRACE_EVENT.size)
+	TRACE_HEADER.pack_into(mem_trace.buf, 0, 0)
+	trace_data = [mem_trace, multiprocessing.Lock()]
+	server_status("Shared memory setup for " + str(TRACE_EVENTS) + " trace events with size " + str(mem_trace.size))
+	return
+
+#==================================================================================================================================
+
+# Return the time a traced phase starts, from a clock every process shares. Returns 0 if tracing is off.
+def trace_start():
+	return time.monotonic_ns() if trace_data is not None else 0
+
+#==================================================================================================================================
+
+# Record a phase from its start until now for this process, with a number such as the chunk it was working on.
+def trace_end(trace_name, trace_begin, trace_arg=0):
+	if trace_data is None:
+		return
+	trace_now = time.monotonic_ns()
+	mem_trace, trace_lock = trace_data
+	with trace_lock:
+		trace_index = TRACE_HEADER.unpack_from(mem_trace.buf, 0)[0]
+		TRACE_HEADER.pack_into(mem_trace.buf, 0, trace_index + 1)
+	if trace_index < TRACE_EVENTS:
+		TRACE_EVENT.pack_into(mem_trace.buf, TRACE_HEADER.size + trace_index * TRACE_EVENT.size, trace_begin, trace_now - trace_begin, os.getpid(), TRACE_NAMES.index(trace_name), trace_arg)
+	return
+
+#==================================================================================================================================
+
+# Export every recorded event as Chrome trace JSON, which Perfetto and chrome://tracing can open, then turn tracing off.
+def trace_export(out_name):
+	mem_trace, trace_lock = trace_data
+	trace_count = TRACE_HEADER.unpack_from(mem_trace.buf, 0)[0]
+	trace_events = []
+	trace_pids = {}
+	for temp_index in range(min(trace_count, TRACE_EVENTS)):
+		trace_begin, trace_length, trace_pid, trace_name, trace_arg = TRACE_EVENT.unpack_from(mem_trace.buf, TRACE_HEADER.size + temp_index * TRACE_EVENT.size)
+		trace_pids.setdefault(trace_pid, "server" if trace_pid == os.getpid() else "child " + str(trace_pid))
+		trace_events.append({"name": TRACE_NAMES[trace_name], "ph": "X", "ts": trace_begin / 1000, "dur": trace_length / 1000, "pid": os.getpid(), "tid": trace_pid, "args": {"arg": trace_arg}})
+	for temp_pid, temp_label in trace_pids.items():
+		trace_events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": temp_pid, "args": {"name": temp_label}})
+	out_handle = open(out_name, "w")
+	json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, out_handle)
+	out_handle.close()
+	trace_shutdown()
+	server_status("Wrote " + str(min(trace_count, TRACE_EVENTS)) + " trace events to " + out_name + ", dropping " + str(max(0, trace_count - TRACE_EVENTS)))
+	return
+
+#==================================================================================================================================
+
+# Add up the seconds every process spent in each phase that started at or after a time, then empty the trace buffer.
+def trace_totals(trace_since):
+	mem_trace, trace_lock = trace_data
+	trace_sums = {}
+	with trace_lock:
+		trace_count = TRACE_HEADER.unpack_from(mem_trace.buf, 0)[0]
+		for temp_index in range(min(trace_count, TRACE_EVENTS)):
+			trace_begin, trace_length, trace_pid, trace_name, trace_arg = TRACE_EVENT.unpack_from(mem_trace.buf, TRACE_HEADER.size + temp_index * TRACE_EVENT.size)
+			if trace_begin >= trace_since:
+				trace_sums[TRACE_NAMES[trace_name]] = trace_sums.get(TRACE_NAMES[trace_name], 0) + trace_length / 1e9
+		TRACE_HEADER.pack_into(mem_trace.buf, 0, 0)
+	return trace_sums
+
+#==================================================================================================================================
+
+# Turn tracing off and clean up the trace buffer.
+def trace_shutdown():
+	global trace_data
+	server_shutdown([trace_data[0]])
+	trace_data = None
+	return
+
+#==================================================================================================================================
+
+#==================================================================================================================================
+
 # A simple function to clean up our server memory on exit.
 def server_shutdown(mem_list):
 	for temp_mem in mem_list:
@@ -138,152 +643,828 @@ def server_shutdown(mem_list):
 
 # Simple consolidation of server prints.
 def server_status(status_message):
-	print("Server status: " + status_message + ".")
+	if status_print:
+		print("Server status: " + status_message + ".")
+	return
+
+#==================================================================================================================================
+
+# Simple consolidation of child prints.
+def child_status(child_id, status_message):
+	if status_print and trace_data is None:
+		print("Child " + str(child_id) + " status: " + status_message + ".")
 	return
 
 #==================================================================================================================================
 
-# Return a free child.
-def child_free(mem_target, child_count):
+# This is where a pool child is started and waits for work. Every job is sorted or merged in whatever memory the pool's context
+# names, which the child attaches to by name and keeps until the server replaces it.
+def child_start(child_id, pool_data):
+	mem_cache = {}
+	mem_views = []
+	context_cache = None
+	beat_data = [pool_data["beat"], child_id]
+	while True:
+		trace_begin = trace_start()
+		chunk_first, chunk_last = queue_get(pool_data["work"], beat_data)
+		trace_end("idle", trace_begin)
+		if chunk_first == JOB_KILL:
+			# Skip the exit handlers, the server's own view of the memory was inherited by the fork and is still open.
+			sys.stdout.flush()
+			os._exit(0)
+		context_data = POOL_CONTEXT.unpack_from(pool_data["context"].buf, 0)
+		if context_data != context_cache:
+			for temp_view in mem_views:
+				temp_view.release()
+			context_cache = context_data
+			chunk_size, chunk_count, rec_count = context_data[:3]
+			share_name, flag_name, rec_name = [temp_name.rstrip(b"\0").decode() for temp_name in context_data[3:]]
+			for temp_name in list(mem_cache):
+				if temp_name not in [share_name, flag_name]:
+					mem_cache.pop(temp_name).close()
+			for temp_name in [share_name, flag_name]:
+				if temp_name not in mem_cache:
+					mem_cache[temp_name] = shared_memory.SharedMemory(name=temp_name)
+			rec_type = record_parse(rec_name)
+			num_view = rec_view(mem_cache[share_name].buf, rec_type)[:rec_count*rec_step(rec_type)]
+			flag_views = flag_view(mem_cache[flag_name], chunk_count)
+			mem_views = [num_view] + flag_views
+		work_list = list(range(chunk_first, chunk_last + 1))
+		flag_gen = flag_claim(flag_views, chunk_first, chunk_last, child_id)
+		beat_mark(beat_data, chunk_first, chunk_last, flag_gen)
+		child_status(child_id, "Found work to do for chunks " + str(work_list))
+		# Dispatched chunks are always contiguous. A single chunk is unsorted, and more than one are sorted runs to merge.
+		trace_begin = trace_start()
+		if len(work_list) == 1:
+			work_data = mem_read(num_view, rec_type, chunk_size, chunk_first, chunk_last)
+			work_sorted = num_sort(work_data)
+			mem_write(num_view, rec_type, chunk_size, chunk_first, rec_pack(work_sorted, rec_type))
+			trace_end("sort", trace_begin, chunk_first)
+			beat_mark(beat_data, chunk_first, chunk_last, flag_gen, 0, len(work_sorted))
+			child_status(child_id, "Sorted chunk " + str(chunk_first))
+		else:
+			mem_start, mem_end = chunk_bounds(num_view, rec_type, chunk_size, chunk_first, chunk_last)
+			work_moved = num_merge(num_view, rec_type, mem_start, mem_end, run_find(num_view, rec_type, chunk_size, chunk_first, chunk_last))
+			trace_end("merge", trace_begin, chunk_first)
+			beat_mark(beat_data, chunk_first, chunk_last, flag_gen, 0, work_moved)
+			child_status(child_id, "Merged chunks " + str(work_list) + " moving " + str(work_moved) + " records")
+		flag_finish(flag_views, chunk_first, chunk_last)
+		queue_put(pool_data["done"], chunk_first, chunk_last, beat_data)
+	return
+
+#==================================================================================================================================
+
+# This is where a child is started for a sample sort. Every child sorts its own block and counts how much of it falls in
+# each bucket, then merges one bucket out of every block into its final place, then copies it back into the records.
+def child_sample(child_id, child_count, mem_share, mem_scratch, mem_count, sample_splits, sample_barrier, rec_type):
+	num_view = rec_view(mem_share.buf, rec_type)
+	scratch_view = rec_view(mem_scratch.buf, rec_type)
+	count_view = mem_count.buf.cast("q")
+	num_count = rec_len(num_view, rec_type)
+	# Sort our own block in place and find where each bucket starts in it.
+	block_start, block_end = block_bounds(num_count, child_count, child_id)
+	trace_begin = trace_start()
+	block_data = num_sort(rec_read(num_view, rec_type, block_start, block_end))
+	rec_write(num_view, rec_type, block_start, rec_pack(block_data, rec_type))
+	trace_end("sort", trace_begin, block_start)
+	bucket_edges = [0] + [bisect.bisect_left(block_data, temp_split) for temp_split in sample_splits] + [len(block_data)]
+	for temp_bucket in range(child_count):
+		count_view[child_id * child_count + temp_bucket] = bucket_edges[temp_bucket + 1] - bucket_edges[temp_bucket]
+	child_status(child_id, "Sorted block " + str([block_start, block_end]) + " into buckets " + str(bucket_edges))
+	trace_begin = trace_start()
+	sample_barrier.wait()
+	trace_end("wait", trace_begin)
+	trace_begin = trace_start()
+	# Our bucket lands after every record in the buckets before it.
+	count_list = count_view.tolist()
+	bucket_start = sum(count_list[temp_id * child_count + temp_bucket] for temp_id in range(child_count) for temp_bucket in range(child_id))
+	bucket_data = []
 	for temp_id in range(child_count):
-		if temp_id not in mem_target.buf:
-			return temp_id
-	return -1
+		temp_start, _ = block_bounds(num_count, child_count, temp_id)
+		temp_start += sum(count_list[temp_id * child_count:temp_id * child_count + child_id])
+		bucket_data.extend(rec_read(num_view, rec_type, temp_start, temp_start + count_list[temp_id * child_count + child_id]))
+	# The pieces are already sorted runs, which the list sort merges in linear time.
+	bucket_data.sort()
+	bucket_end = bucket_start + len(bucket_data)
+	if bucket_data:
+		rec_write(scratch_view, rec_type, bucket_start, rec_pack(bucket_data, rec_type))
+	trace_end("merge", trace_begin, bucket_start)
+	child_status(child_id, "Merged bucket " + str([bucket_start, bucket_end]))
+	# Wait until every child is done reading the blocks before overwriting them.
+	trace_begin = trace_start()
+	sample_barrier.wait()
+	trace_end("wait", trace_begin)
+	trace_begin = trace_start()
+	rec_step_size = rec_step(rec_type)
+	num_view[bucket_start*rec_step_size:bucket_end*rec_step_size] = scratch_view[bucket_start*rec_step_size:bucket_end*rec_step_size]
+	trace_end("write", trace_begin, bucket_start)
+	# Skip the exit handlers, the server's own view of the memory was inherited by the fork and is still open.
+	sys.stdout.flush()
+	os._exit(0)
+	return
 
 #==================================================================================================================================
 
-# Simple consolidation of child prints.
-def child_status(child_id, status_message):
-	print("Child " + str(child_id) + " status: " + status_message + ".")
+# Setup the scratch memory for a sample sort, then create the children and wait for them to finish.
+def sample_start(num_view, mem_share, child_count, rec_type):
+	mem_size_scratch = max(mem_share.size, 1)
+	mem_scratch = shared_memory.SharedMemory(create=True, size=mem_size_scratch)
+	server_status("Shared memory setup for the sample sort scratch with size " + str(mem_size_scratch))
+	mem_count = shared_memory.SharedMemory(create=True, size=child_count * child_count * 8)
+	server_status("Shared memory setup for bucket counts with size " + str(child_count * child_count * 8))
+	sample_splits = sample_split(num_view, rec_type, child_count)
+	server_status("Picked bucket splits " + str(list(map(rec_type[4], sample_splits))))
+	sample_barrier = multiprocessing.Barrier(child_count)
+	proc_list = []
+	for temp_id in range(0, child_count):
+		proc_pid = os.fork()
+		if proc_pid == 0:
+			child_sample(temp_id, child_count, mem_share, mem_scratch, mem_count, sample_splits, sample_barrier, rec_type)
+		else:
+			proc_list.append(proc_pid)
+			server_status("Created child with ID " + str(temp_id))
+	for temp_pid in proc_list:
+		os.waitpid(temp_pid, 0)
+	server_shutdown([mem_scratch, mem_count])
 	return
 
 #==================================================================================================================================
 
-# This is where a child is started and looks for work.
-def child_start(child_id, mem_share, mem_flag, mem_kill, byte_size, flag_guide):
-	flag_pos = 0
+# Find how many bytes of memory are free right now, or a safe guess if the system won't say.
+def memory_free():
+	try:
+		return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+	except (ValueError, OSError, AttributeError):
+		return MEMORY_DEFAULT
+
+#==================================================================================================================================
+
+# Pick how many bytes of input go in each external sort run, so every child's run fits in free memory at once. A record
+# takes a lot more room as a Python object in a list than as text, so leave plenty of headroom. Small inputs are still split so
+# every child gets a run.
+def run_auto(file_size, child_count, memory_bytes):
+	return max(RUN_MIN, min(memory_bytes // (child_count * RUN_FACTOR), math.ceil(file_size / child_count)))
+
+#==================================================================================================================================
+
+# Find the first delimiter at or after a position in the input, or the end of the input.
+def file_delim(file_map, file_pos):
+	file_match = FILE_DELIM.search(file_map, file_pos)
+	return file_match.start() if file_match else len(file_map)
+
+#==================================================================================================================================
+
+# Split a memory mapped input into byte ranges of about a run each, moving every cut forward to a delimiter.
+def file_runs(file_map, run_bytes):
+	run_list = []
+	run_start = 0
+	while run_start < len(file_map):
+		run_end = file_delim(file_map, min(len(file_map), run_start + run_bytes))
+		run_list.append([run_start, run_end])
+		run_start = run_end + 1
+	return run_list
+
+#==================================================================================================================================
+
+# Return the path of a sorted run file.
+def run_path(run_dir, run_index):
+	return os.path.join(run_dir, str(run_index) + ".run")
+
+#==================================================================================================================================
+
+# Stream the records of a sorted run file back a block at a time, so a merge only holds a block of every run in memory.
+def run_stream(run_name, rec_type):
+	run_handle = open(run_name, "rb")
 	while True:
-		work_list = [temp_index for temp_index, temp_check in enumerate(mem_flag.buf) if temp_check == child_id]
-		if work_list:
-			child_status(child_id, "Found work to do for chunks " + str(work_list))
-			work_data = []
-			for temp_chunk in work_list:
-				work_data.extend(mem_read(mem_share, temp_chunk, byte_size))
-			work_sorted = num_sort(work_data)
-			work_casted, _ = byte_cast(work_sorted)
-			mem_write(mem_share, work_list[0], work_casted, byte_size)
-			child_status(child_id, "Sorted and merged chunks " + str(work_list))
-			work_status = [flag_guide["head"]]
-			if len(work_list) > 1:
-				work_status.extend([flag_guide["body"]] * (len(work_list) - 1))
-			mem_flag.buf[work_list[0]:work_list[-1]+1] = bytes(work_status)
-		elif mem_kill.buf[0] == 1:
-			sys.exit()
+		run_block = run_handle.read(MERGE_BLOCK * rec_type[1])
+		if not run_block:
+			break
+		if rec_type[2]:
+			yield from array.array(rec_type[2], run_block)
+		else:
+			yield from [run_block[temp_pos:temp_pos+rec_type[1]] for temp_pos in range(0, len(run_block), rec_type[1])]
+	run_handle.close()
 	return
 
 #==================================================================================================================================
 
-# Setup the memory sorting server which will create and dispatch children.
-def server_setup(file_data, child_count):
-	# Convert our file data to the least needed byte amount.
-	byte_data, byte_size = byte_cast(file_data)
-	# Figure out the size of our shared memory sectors.
-	mem_size_share = len(byte_data) * byte_size
-	mem_size_flag = math.ceil(len(byte_data) / 100)
-	# Setup our shared memory for number data.
-	mem_share = shared_memory.SharedMemory(name="share", create=True, size=mem_size_share)
-	server_status("Shared memory setup for numbers with size " + str(mem_size_share))
-	# Setup shared memory for flag statuses.
-	mem_flag = shared_memory.SharedMemory(name="flag", create=True, size=mem_size_flag)
-	server_status("Shared memory setup for flags with size " + str(mem_size_flag))
-	# Make them all the "unsorted" flag code.
-	for temp_index in range(mem_size_flag):
-		mem_flag.buf[temp_index] = child_count
-	# Setup shared memory for the kill flag.
-	mem_kill = shared_memory.SharedMemory(name="kill", create=True, size=1)
-	server_status("Shared memory setup for the kill flag")
-	# Create a quick reference for flag codes.
-	flag_guide = {
-		"unsorted": child_count,
-		"head": child_count + 1,
-		"body": child_count + 2,
-	}
-	# Write our data to our memory.
-	mem_write(mem_share, 0, byte_data, byte_size)
-	server_status("Wrote numbers as bytes to shared memory")
-	# Create the specified number of child processes.
+# Stream a merge of sorted run files to an output file a block at a time. The output is either another run file of packed
+# records, or space delimited text. Returns how many records were written.
+def run_merge(run_names, out_name, out_text, rec_type):
+	out_handle = open(out_name, "wb")
+	out_block = []
+	out_count = 0
+	for temp_rec in heapq.merge(*[run_stream(temp_name, rec_type) for temp_name in run_names]):
+		out_block.append(temp_rec)
+		if len(out_block) == MERGE_BLOCK:
+			out_count += run_flush(out_handle, out_block, out_text, rec_type)
+			out_block = []
+	out_count += run_flush(out_handle, out_block, out_text, rec_type)
+	out_handle.close()
+	return out_count
+
+# Write a block of merged records as packed records or text. Returns how many records were written.
+def run_flush(out_handle, out_block, out_text, rec_type):
+	if out_text and out_block:
+		out_handle.write((" ".join(map(rec_type[4], out_block)) + " ").encode("latin-1"))
+	elif out_block:
+		out_handle.write(rec_pack(out_block, rec_type))
+	return len(out_block)
+
+#==================================================================================================================================
+
+# This is where a child is started for an external sort. Every run it is handed is parsed from the input, sorted, and spilled
+# to a run file of packed records.
+def child_external(child_id, file_name, run_list, run_dir, queue_work, queue_done, rec_type):
+	file_handle = open(file_name, "rb")
+	file_map = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+	file_handle.close()
+	while True:
+		run_index, _ = queue_get(queue_work)
+		if run_index == JOB_KILL:
+			file_map.close()
+			sys.stdout.flush()
+			os._exit(0)
+		run_start, run_end = run_list[run_index]
+		trace_begin = trace_start()
+		if file_binary(file_name, rec_type):
+			run_data = array.array(rec_type[2], file_map[run_start:run_end])
+		else:
+			try:
+				run_data = list(map(rec_type[3], file_map[run_start:run_end].split()))
+			except (OverflowError, ValueError):
+				run_data = None
+		trace_end("parse", trace_begin, run_index)
+		if run_data is not None:
+			trace_begin = trace_start()
+			run_data = rec_pack(num_sort(run_data), rec_type)
+			trace_end("sort", trace_begin, run_index)
+		if run_data is None:
+			child_status(child_id, "Error: Found a record in run " + str(run_index) + " that can't be parsed or doesn't fit the " + rec_type[0] + " record type")
+			queue_put(queue_done, run_index, JOB_FAIL)
+			continue
+		trace_begin = trace_start()
+		run_handle = open(run_path(run_dir, run_index), "wb")
+		run_handle.write(run_data)
+		run_handle.close()
+		trace_end("write", trace_begin, run_index)
+		child_status(child_id, "Sorted run " + str(run_index) + " of " + str(rec_len(run_data, rec_type)) + " records to disk")
+		queue_put(queue_done, run_index, run_index)
+	return
+
+#==================================================================================================================================
+
+# Sort an input file that may not fit in memory. Children sort runs of it to temporary files, then the server streams a merge
+# of every run to the output file, holding only a block of each run in memory at a time. Too many runs to merge at once are
+# merged in groups first.
+def external_start(file_name, child_count, run_bytes, out_name, rec_type):
+	file_size = os.path.getsize(file_name)
+	if run_bytes <= 0:
+		memory_bytes = memory_free()
+		run_bytes = run_auto(file_size, child_count, memory_bytes)
+		server_status("Picked run size " + str(run_bytes) + " bytes for " + str(child_count) + " children and " + str(memory_bytes) + " free bytes of memory")
+	else:
+		server_status("Set run size to " + str(run_bytes) + " bytes")
+	if file_binary(file_name, rec_type) and file_size % rec_type[1] != 0:
+		server_status("Error: A binary input file must be a whole number of " + rec_type[0] + " records")
+		return
+	if file_size == 0:
+		open(out_name, "w").close()
+		server_status("Wrote an empty output to " + out_name)
+		return
+	if file_binary(file_name, rec_type):
+		# Binary runs are cut on whole records instead of delimiters.
+		run_bytes = max(rec_type[1], run_bytes - run_bytes % rec_type[1])
+		run_list = [[temp_start, min(file_size, temp_start + run_bytes)] for temp_start in range(0, file_size, run_bytes)]
+	else:
+		file_handle = open(file_name, "rb")
+		file_map = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+		file_handle.close()
+		run_list = file_runs(file_map, run_bytes)
+		file_map.close()
+	server_status("Split " + file_name + " into " + str(len(run_list)) + " runs")
+	run_dir = tempfile.mkdtemp(prefix="sort-")
+	queue_work = queue_setup("work", len(run_list) + child_count)
+	queue_done = queue_setup("done", len(run_list))
+	proc_list = []
 	for temp_id in range(0, child_count):
 		proc_pid = os.fork()
 		if proc_pid == 0:
-			child_start(temp_id, mem_share, mem_flag, mem_kill, byte_size, flag_guide)
+			child_external(temp_id, file_name, run_list, run_dir, queue_work, queue_done, rec_type)
 		else:
+			proc_list.append(proc_pid)
 			server_status("Created child with ID " + str(temp_id))
-	# Start our server as our work dispatcher.
-	server_start(mem_flag, mem_kill, child_count, flag_guide)
+	for temp_index in range(len(run_list)):
+		queue_put(queue_work, temp_index, temp_index)
+	run_failed = False
+	for temp_index in range(len(run_list)):
+		_, run_status = queue_get(queue_done)
+		if run_status == JOB_FAIL:
+			run_failed = True
+	for temp_id in range(child_count):
+		queue_put(queue_work, JOB_KILL, JOB_KILL)
+	for temp_pid in proc_list:
+		os.waitpid(temp_pid, 0)
+	server_shutdown([queue_work[0], queue_done[0]])
+	# Merge the runs in groups until there are few enough to merge straight to the output.
+	if run_failed:
+		server_status("Error: Every record must be a valid " + rec_type[0] + " record that fits its type")
+	else:
+		run_names = [run_path(run_dir, temp_index) for temp_index in range(len(run_list))]
+		merge_pass = 0
+		while len(run_names) > MERGE_FAN:
+			merge_names = []
+			for temp_start in range(0, len(run_names), MERGE_FAN):
+				merge_names.append(os.path.join(run_dir, "pass" + str(merge_pass) + "-" + str(len(merge_names)) + ".run"))
+				run_merge(run_names[temp_start:temp_start+MERGE_FAN], merge_names[-1], False, rec_type)
+				for temp_name in run_names[temp_start:temp_start+MERGE_FAN]:
+					os.remove(temp_name)
+			server_status("Merged " + str(len(run_names)) + " runs down to " + str(len(merge_names)))
+			run_names = merge_names
+			merge_pass += 1
+		trace_begin = trace_start()
+		out_count = run_merge(run_names, out_name, not file_binary(out_name, rec_type), rec_type)
+		trace_end("merge", trace_begin)
+		server_status("Merged " + str(out_count) + " records from " + str(len(run_names)) + " runs to " + out_name)
+	for temp_name in os.listdir(run_dir):
+		os.remove(os.path.join(run_dir, temp_name))
+	os.rmdir(run_dir)
+	return
+
+#==================================================================================================================================
+
+# Check if a file holds raw records of a type instead of text. Only types with a binary extension have binary files.
+def file_binary(file_name, rec_type):
+	return rec_type[5] is not None and file_name.endswith(rec_type[5])
+
+#==================================================================================================================================
+
+# This is where a child is started to parse part of a text input. It counts its records, waits for the server to make the
+# shared memory for every child's records, then writes its own right after the records of the children before it. A part
+# that can't be parsed is counted as -1, and the child always reaches both barriers so nobody is left waiting on it.
+def child_parse(child_id, file_map, part_range, mem_count, parse_barrier, rec_type, mem_name):
+	child_code = 1
+	try:
+		count_view = mem_count.buf.cast("q")
+		part_data = None
+		try:
+			trace_begin = trace_start()
+			part_data = rec_pack(map(rec_type[3], file_map[part_range[0]:part_range[1]].split()), rec_type)
+			trace_end("parse", trace_begin, child_id)
+		finally:
+			count_view[child_id] = -1 if part_data is None else rec_len(part_data, rec_type)
+			trace_begin = trace_start()
+			parse_barrier.wait()
+			parse_barrier.wait()
+			trace_end("wait", trace_begin)
+		if min(count_view) >= 0:
+			trace_begin = trace_start()
+			mem_share = shared_memory.SharedMemory(name=mem_name)
+			num_view = rec_view(mem_share.buf, rec_type)
+			rec_write(num_view, rec_type, sum(count_view[:child_id]), part_data)
+			num_view.release()
+			mem_share.close()
+			trace_end("write", trace_begin, child_id)
+		count_view.release()
+		child_code = 0
+	finally:
+		sys.stdout.flush()
+		os._exit(child_code)
+	return
+
+#==================================================================================================================================
+
+# Load an input file into new shared memory for records, and return it and how many records it holds. A binary file is read
+# straight into the shared memory. A text file is cut into one part per child on delimiters, and parsed by every child at once.
+def file_load(file_name, child_count, rec_type):
+	file_size = os.path.getsize(file_name)
+	file_handle = open(file_name, "rb")
+	if file_binary(file_name, rec_type):
+		if file_size == 0 or file_size % rec_type[1] != 0:
+			file_handle.close()
+			server_status("Error: A binary input file must be a whole, non zero number of " + rec_type[0] + " records")
+			return None, 0
+		trace_begin = trace_start()
+		mem_share = shared_memory.SharedMemory(create=True, size=file_size)
+		file_handle.readinto(mem_share.buf)
+		file_handle.close()
+		trace_end("read", trace_begin)
+		server_status("Read in " + str(file_size // rec_type[1]) + " records from " + file_name)
+		return mem_share, file_size // rec_type[1]
+	if file_size == 0:
+		file_handle.close()
+		server_status("Error: The input file has no records")
+		return None, 0
+	file_map = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+	file_handle.close()
+	part_list = file_runs(file_map, math.ceil(file_size / child_count))
+	mem_count = shared_memory.SharedMemory(create=True, size=len(part_list) * 8)
+	mem_name = mem_unique()
+	parse_barrier = multiprocessing.Barrier(len(part_list) + 1)
+	proc_list = []
+	for temp_id in range(len(part_list)):
+		proc_pid = os.fork()
+		if proc_pid == 0:
+			child_parse(temp_id, file_map, part_list[temp_id], mem_count, parse_barrier, rec_type, mem_name)
+		else:
+			proc_list.append(proc_pid)
+	# Wait for every part to be counted before making room for them.
+	parse_barrier.wait()
+	count_list = mem_count.buf.cast("q").tolist()
+	mem_share = None
+	if min(count_list) < 0:
+		server_status("Error: Every record must be a valid " + rec_type[0] + " record that fits its type")
+	elif sum(count_list) == 0:
+		server_status("Error: The input file has no records")
+	else:
+		mem_share = shared_memory.SharedMemory(name=mem_name, create=True, size=sum(count_list) * rec_type[1])
+	# Mark a count bad to tell the children there's no memory to write to.
+	if mem_share is None:
+		mem_count.buf[0:8] = struct.pack("<q", -1)
+	parse_barrier.wait()
+	for temp_pid in proc_list:
+		os.waitpid(temp_pid, 0)
+	file_map.close()
+	server_shutdown([mem_count])
+	if mem_share is None:
+		return None, 0
+	server_status("Read in " + str(sum(count_list)) + " records from " + file_name + " with " + str(len(part_list)) + " children")
+	return mem_share, sum(count_list)
+
+#==================================================================================================================================
+
+# This is where a child is started to turn part of the sorted records into text. It measures its text, waits for every other
+# child to measure theirs, then writes its own right after the text of the children before it.
+def child_format(child_id, num_view, part_range, out_name, mem_count, format_barrier, rec_type):
+	count_view = mem_count.buf.cast("q")
+	part_text = b""
+	trace_begin = trace_start()
+	if part_range[1] > part_range[0]:
+		part_text = (" ".join(map(rec_type[4], rec_read(num_view, rec_type, part_range[0], part_range[1]))) + " ").encode("latin-1")
+	trace_end("format", trace_begin, child_id)
+	count_view[child_id] = len(part_text)
+	trace_begin = trace_start()
+	format_barrier.wait()
+	trace_end("wait", trace_begin)
+	trace_begin = trace_start()
+	out_handle = os.open(out_name, os.O_WRONLY)
+	os.pwrite(out_handle, part_text, sum(count_view[:child_id]))
+	os.close(out_handle)
+	trace_end("write", trace_begin, child_id)
+	count_view.release()
+	sys.stdout.flush()
+	os._exit(0)
+	return
+
+#==================================================================================================================================
+
+# Store the sorted records to an output file. A binary file gets the shared memory as is. Text is made and written by every
+# child at once.
+def file_store(num_view, out_name, child_count, rec_type):
+	num_count = rec_len(num_view, rec_type)
+	out_handle = open(out_name, "wb")
+	if file_binary(out_name, rec_type):
+		out_handle.write(num_view)
+		out_handle.close()
+		server_status("Wrote " + str(num_count) + " records to " + out_name)
+		return
+	out_handle.close()
+	mem_count = shared_memory.SharedMemory(create=True, size=child_count * 8)
+	format_barrier = multiprocessing.Barrier(child_count)
+	proc_list = []
+	for temp_id in range(child_count):
+		proc_pid = os.fork()
+		if proc_pid == 0:
+			child_format(temp_id, num_view, block_bounds(num_count, child_count, temp_id), out_name, mem_count, format_barrier, rec_type)
+		else:
+			proc_list.append(proc_pid)
+	for temp_pid in proc_list:
+		os.waitpid(temp_pid, 0)
+	server_shutdown([mem_count])
+	server_status("Wrote " + str(num_count) + " records to " + out_name + " with " + str(child_count) + " children")
+	return
+
+#==================================================================================================================================
+
+# Setup the memory sorting server which will create and dispatch children.
+def server_setup(file_name, child_count, sort_mode="merge", chunk_size=0, out_name="./sorted.txt", rec_type=None):
+	if rec_type is None:
+		rec_type = record_parse("int")
+	# Load our input straight into shared memory as records.
+	trace_begin = trace_start()
+	mem_share, num_count = file_load(file_name, child_count, rec_type)
+	trace_end("load", trace_begin)
+	if mem_share is None:
+		return
+	server_status("Shared memory setup for " + rec_type[0] + " records with size " + str(mem_share.size))
+	num_view = rec_view(mem_share.buf, rec_type)[:num_count*rec_step(rec_type)]
+	# A sample sort doesn't need a dispatcher or any flags.
+	if sort_mode == "sample":
+		sample_start(num_view, mem_share, child_count, rec_type)
+		trace_begin = trace_start()
+		file_store(num_view, out_name, child_count, rec_type)
+		trace_end("dump", trace_begin)
+		num_view.release()
+		server_shutdown([mem_share])
+		return
+	# Figure out how big the chunks are, and so how many flags we need.
+	if chunk_size <= 0:
+		cache_bytes = cache_size()
+		chunk_size = chunk_auto(num_count, child_count, cache_bytes)
+		server_status("Picked chunk size " + str(chunk_size) + " for " + str(num_count) + " records, " + str(child_count) + " children, and a " + str(cache_bytes) + " byte L2 cache")
+	else:
+		server_status("Set chunk size to " + str(chunk_size))
+	# Start a pool with room in its queues for every chunk, and hand it our records.
+	pool_data = pool_setup(child_count, math.ceil(num_count / chunk_size))
+	pool_data["share"] = mem_share
+	pool_sort(pool_data, num_count, rec_type, chunk_size)
 	# Output the finished sort.
-	mem_dump(mem_share, byte_size)
-	# Clean up the shared memory portions.
-	server_shutdown([mem_share, mem_flag, mem_kill])
-	return
-
-#==================================================================================================================================
-
-# This is where the server is started and dispatches work.
-def server_start(mem_flag, mem_kill, child_count, flag_guide):
-	# The server begins dispatching jobs and checking end state.
-	while (mem_flag.buf[0] != flag_guide["head"]) or any(temp_check != flag_guide["body"] for temp_check in mem_flag.buf[1:]):
-		# Keep track of which chunks are being worked on.
-		work_tracker = []
-		flag_list = list(enumerate(mem_flag.buf))
-		for temp_pair in flag_list:
-			# Wait for the next free child.
-			child_next = -1
-			while child_next == -1:
-				child_next = child_free(mem_flag, child_count)
-			# Skip the checking of already assigned chunks.
-			if temp_pair[1] < child_count:
-				continue
-			# Dispatch a child to sort an unsorted chunk.
-			elif temp_pair[1] == flag_guide["unsorted"] and temp_pair[0] not in work_tracker:
-				mem_flag.buf[temp_pair[0]] = child_next
-				work_tracker.append(temp_pair[0])
-				server_status("Dispatched for child " + str(child_next) + " to sort chunk " + str(temp_pair[0]))
-			# Dispatch a child to merge and sort multiple chunks.
-			elif temp_pair[1] == flag_guide["head"] and temp_pair[0] not in work_tracker:
-				chunk_next = temp_pair[0] + 1
-				# Look for another chunk head.
-				while chunk_next != len(mem_flag.buf):
-					if flag_list[chunk_next][1] == flag_guide["head"]:
-						break
-					elif flag_list[chunk_next][1] != flag_guide["body"]:
-						chunk_next = -1
-						break
-					chunk_next += 1
-				else:
-					continue
-				if chunk_next == -1:
-					continue
-				chunk_end = chunk_next + 1
-				# Look for extra body after another chunk head.
-				while chunk_end != len(mem_flag.buf):
-					if flag_list[chunk_end][1] != flag_guide["body"]:
-						break
-					chunk_end += 1
-				chunk_end -= 1
-				# Dispatch the work in a bulk write to edge out race conditions.
-				work_status = [child_next] * ((chunk_end - temp_pair[0]) + 1)
-				mem_flag.buf[temp_pair[0]:chunk_end+1] = bytes(work_status)
-				work_tracker.append(temp_pair[0])
-				work_tracker.append(flag_list[chunk_next][0])
-				server_status("Dispatched for child " + str(child_next) + " to sort chunks " + str(list(range(temp_pair[0], chunk_end + 1))))
-	# Send the signal for children to kill themselves.
-	mem_kill.buf[0] = 1
-	time.sleep(0.1)
+	trace_begin = trace_start()
+	file_store(num_view, out_name, child_count, rec_type)
+	trace_end("dump", trace_begin)
+	# Release our view before cleaning up, shared memory can't be closed while it is still being viewed.
+	num_view.release()
+	# Stop the pool, which cleans up the shared memory portions.
+	pool_shutdown(pool_data)
+	return
+
+#==================================================================================================================================
+
+# This is where the server is started and dispatches work. Every chunk is queued to be sorted, then every finished run is
+# queued to be merged with a finished run right next to it, until one run covers every chunk. Whenever no run finishes for a
+# while, dead children are reaped and their chunks queued again or counted as done, and if nothing has finished for a long
+# while the chunk states and every child's heartbeat are reported.
+def server_start(pool_data, chunk_count):
+	queue_work = pool_data["work"]
+	queue_done = pool_data["done"]
+	trace_begin = trace_start()
+	for temp_chunk in range(chunk_count):
+		queue_put(queue_work, temp_chunk, temp_chunk)
+	trace_end("dispatch", trace_begin, chunk_count)
+	server_status("Dispatched " + str(chunk_count) + " chunks to sort")
+	# Finished runs that are waiting for a neighbour, by first chunk and by last chunk.
+	run_firsts = {}
+	run_lasts = {}
+	beat_last = time.monotonic()
+	while True:
+		trace_begin = trace_start()
+		chunk_first, chunk_last = queue_get(queue_done, None, BEAT_WAIT)
+		trace_end("wait", trace_begin)
+		if chunk_first == JOB_WAIT:
+			reap_jobs, reap_done = pool_reap(pool_data, chunk_count)
+			for temp_first, temp_last in reap_jobs:
+				queue_put(queue_work, temp_first, temp_last)
+				server_status("Dispatched chunks " + str(temp_first) + " to " + str(temp_last) + " again")
+			for temp_first, temp_last in reap_done:
+				queue_put(queue_done, temp_first, temp_last)
+				server_status("Found chunks " + str(temp_first) + " to " + str(temp_last) + " already finished")
+			if time.monotonic() - beat_last > BEAT_STALL:
+				server_status("No chunks finished in " + str(BEAT_STALL) + " seconds, chunks are " + str(flag_status(pool_data["flag"], chunk_count)) + ", heartbeats are " + str(beat_status(pool_data["beat"], len(pool_data["pids"]))))
+				beat_last = time.monotonic()
+			continue
+		beat_last = time.monotonic()
+		if chunk_first == 0 and chunk_last == chunk_count - 1:
+			break
+		trace_begin = trace_start()
+		if chunk_first - 1 in run_lasts:
+			merge_first = run_lasts.pop(chunk_first - 1)
+			del run_firsts[merge_first]
+			queue_put(queue_work, merge_first, chunk_last)
+			trace_end("dispatch", trace_begin, merge_first)
+			if trace_data is None:
+				server_status("Dispatched chunks " + str(merge_first) + " to " + str(chunk_last) + " to merge")
+		elif chunk_last + 1 in run_firsts:
+			merge_last = run_firsts.pop(chunk_last + 1)
+			del run_lasts[merge_last]
+			queue_put(queue_work, chunk_first, merge_last)
+			trace_end("dispatch", trace_begin, chunk_first)
+			if trace_data is None:
+				server_status("Dispatched chunks " + str(chunk_first) + " to " + str(merge_last) + " to merge")
+		else:
+			run_firsts[chunk_first] = chunk_last
+			run_lasts[chunk_last] = chunk_first
+	return
+
+#==================================================================================================================================
+
+# Make a list of random numbers in one of the bench distributions.
+def bench_data(bench_dist, num_count, bench_random):
+	if bench_dist == "duplicates":
+		return [bench_random.randint(0, 15) for temp_itr in range(num_count)]
+	elif bench_dist == "zipf":
+		# Rank k comes up in proportion to 1 / k^s, for ranks up to a fixed count.
+		zipf_weights = []
+		zipf_total = 0
+		for temp_rank in range(1, BENCH_RANKS + 1):
+			zipf_total += 1 / temp_rank ** BENCH_ZIPF
+			zipf_weights.append(zipf_total)
+		return bench_random.choices(range(1, BENCH_RANKS + 1), cum_weights=zipf_weights, k=num_count)
+	num_list = [bench_random.randint(-(1 << 62), 1 << 62) for temp_itr in range(num_count)]
+	if bench_dist == "sorted":
+		num_list.sort()
+	elif bench_dist == "reversed":
+		num_list.sort(reverse=True)
+	return num_list
+
+#==================================================================================================================================
+
+# Time a plain sorted() call on a list of numbers, as the baseline to beat.
+def bench_base(num_list):
+	bench_start = time.perf_counter()
+	sorted(num_list)
+	return time.perf_counter() - bench_start
+
+#==================================================================================================================================
+
+# Time one sort of a list of numbers, split into packing them into shared memory, sorting, and reading them back out. Returns
+# those times in seconds, the seconds every process spent in each traced phase of the sort, and if the result was sorted right.
+def bench_time(pool_data, num_list, sort_mode, child_count):
+	rec_type = record_parse("int")
+	bench_times = {}
+	trace_since = time.monotonic_ns()
+	bench_start = time.perf_counter()
+	rec_data = rec_pack(num_list, rec_type)
+	if sort_mode == "sample":
+		mem_share = shared_memory.SharedMemory(create=True, size=len(rec_data) * rec_type[1])
+	else:
+		mem_share = pool_share(pool_data, len(rec_data) * rec_type[1])
+	num_view = rec_view(mem_share.buf, rec_type)[:len(rec_data)]
+	num_view[:] = rec_data
+	bench_times["pack"] = time.perf_counter() - bench_start
+	bench_start = time.perf_counter()
+	if sort_mode == "sample":
+		sample_start(num_view, mem_share, child_count, rec_type)
+	else:
+		chunk_size = max(chunk_auto(len(rec_data), child_count, cache_size()), math.ceil(len(rec_data) / pool_data["jobs"]))
+		pool_sort(pool_data, len(rec_data), rec_type, chunk_size)
+	bench_times["sort"] = time.perf_counter() - bench_start
+	bench_start = time.perf_counter()
+	num_sorted = num_view.tolist()
+	bench_times["unpack"] = time.perf_counter() - bench_start
+	num_view.release()
+	if sort_mode == "sample":
+		server_shutdown([mem_share])
+	return bench_times, trace_totals(trace_since), num_sorted == sorted(num_list)
+
+#==================================================================================================================================
+
+# Print a table of one result column for a distribution and sort mode, with a row per size and a column per child count.
+def bench_table(bench_rows, bench_dist, sort_mode, bench_column):
+	child_counts = sorted(set(temp_row["children"] for temp_row in bench_rows))
+	print("Bench status: " + bench_column + " for " + bench_dist + " numbers with the " + sort_mode + " sort.")
+	print("size".rjust(12) + "".join(("x" + str(temp_count)).rjust(10) for temp_count in child_counts))
+	for temp_size in sorted(set(temp_row["size"] for temp_row in bench_rows)):
+		table_cells = {temp_row["children"]: temp_row[bench_column] for temp_row in bench_rows if temp_row["size"] == temp_size and temp_row["dist"] == bench_dist and temp_row["mode"] == sort_mode}
+		print(str(temp_size).rjust(12) + "".join(str(round(table_cells.get(temp_count, 0), 2)).rjust(10) for temp_count in child_counts))
 	return
 
 #==================================================================================================================================
 
+# Write the bench results to a CSV file if the name ends in .csv, or JSON otherwise.
+def bench_write(bench_rows, out_name):
+	out_handle = open(out_name, "w", newline="")
+	if out_name.endswith(".csv"):
+		out_writer = csv.DictWriter(out_handle, fieldnames=list(bench_rows[0]))
+		out_writer.writeheader()
+		out_writer.writerows(bench_rows)
+	else:
+		json.dump(bench_rows, out_handle, indent="\t")
+	out_handle.close()
+	return
+
+#==================================================================================================================================
+
+# Run the bench over every size from the smallest up to a max in powers of ten, every child count, every distribution, and
+# both sort modes. Every run is repeated and the fastest kept, then compared to sorted() on the same list. Tracing is on for
+# the whole bench, so the time spent in each phase of the sort can be added up from the trace buffer.
+def bench_setup(bench_max, child_counts, out_name):
+	global status_print
+	status_print = False
+	trace_setup()
+	bench_random = random.Random(0)
+	bench_sizes = [10 ** temp_power for temp_power in range(int(math.log10(BENCH_MIN)), int(math.log10(bench_max)) + 1)]
+	bench_rows = []
+	for temp_count in child_counts:
+		pool_start = time.perf_counter()
+		pool_data = pool_setup(temp_count, POOL_JOBS)
+		print("Bench status: Started a pool of " + str(temp_count) + " children in " + str(round((time.perf_counter() - pool_start) * 1000, 2)) + " ms.")
+		for temp_size in bench_sizes:
+			for temp_dist in BENCH_DISTS:
+				num_list = bench_data(temp_dist, temp_size, bench_random)
+				base_time = min(bench_base(num_list) for temp_itr in range(BENCH_REPEAT))
+				for temp_mode in BENCH_MODES:
+					bench_runs = [bench_time(pool_data, num_list, temp_mode, temp_count) for temp_itr in range(BENCH_REPEAT)]
+					bench_best, bench_busy, _ = min(bench_runs, key=lambda temp_run: sum(temp_run[0].values()))
+					bench_total = sum(bench_best.values())
+					bench_rows.append({
+						"size": temp_size,
+						"dist": temp_dist,
+						"mode": temp_mode,
+						"children": temp_count,
+						"pack": bench_best["pack"],
+						"sort": bench_best["sort"],
+						"unpack": bench_best["unpack"],
+						"total": bench_total,
+						"baseline": base_time,
+						"speedup": base_time / bench_total,
+						"efficiency": base_time / bench_total / temp_count,
+						"correct": all(temp_run[2] for temp_run in bench_runs),
+					})
+					for temp_phase in BENCH_PHASES:
+						bench_rows[-1]["busy_" + temp_phase] = bench_busy.get(temp_phase, 0)
+					print("Bench status: " + temp_mode + " sorted " + str(temp_size) + " " + temp_dist + " numbers with " + str(temp_count) + " children in " + str(round(bench_total * 1000, 2)) + " ms, sorted() took " + str(round(base_time * 1000, 2)) + " ms.")
+		pool_shutdown(pool_data)
+	for temp_dist in BENCH_DISTS:
+		for temp_mode in BENCH_MODES:
+			bench_table(bench_rows, temp_dist, temp_mode, "speedup")
+			bench_table(bench_rows, temp_dist, temp_mode, "efficiency")
+	if not all(temp_row["correct"] for temp_row in bench_rows):
+		print("Bench status: Error: Some sorts came out wrong.")
+	trace_shutdown()
+	bench_write(bench_rows, out_name)
+	print("Bench status: Wrote " + str(len(bench_rows)) + " results to " + out_name + ".")
+	return
+
+#==================================================================================================================================
+
+# Sort an iterable of ints or floats with a pool of children, and return a sorted list like sorted() does. The pool and its
+# memory stay warm between calls, and are cleaned up when the program exits. If any number is a float, every number comes
+# back as a float. Raises OverflowError if a number doesn't fit in 64 bits, and ValueError if an int mixed in with floats is
+# too big for a float to hold exactly. Status messages are turned off for the call.
+def parallel_sort(num_list, workers=None):
+	global pool_cached, status_print
+	child_count = workers if workers else os.cpu_count()
+	num_list = list(num_list)
+	rec_type = record_parse("float" if any(isinstance(temp_num, float) for temp_num in num_list) else "int")
+	if rec_type[0] == "float" and any(isinstance(temp_num, int) and abs(temp_num) > FLOAT_EXACT for temp_num in num_list):
+		raise ValueError("An int mixed in with floats is too big for a float to hold exactly")
+	rec_data = rec_pack(num_list, rec_type)
+	if rec_data is None:
+		raise OverflowError("A number doesn't fit in 64 bits")
+	if len(rec_data) == 0:
+		return []
+	# A pool made by the process we were forked from isn't ours to use or stop.
+	if pool_cached is not None and pool_cached["owner"] != os.getpid():
+		pool_cached = None
+	status_saved = status_print
+	status_print = False
+	try:
+		if pool_cached is not None and len(pool_cached["pids"]) != child_count:
+			pool_shutdown(pool_cached)
+			pool_cached = None
+		if pool_cached is None:
+			pool_cached = pool_setup(child_count, POOL_JOBS)
+		mem_share = pool_share(pool_cached, len(rec_data) * rec_type[1])
+		num_view = rec_view(mem_share.buf, rec_type)[:len(rec_data)]
+		num_view[:] = rec_data
+		# Chunks can't outnumber the room in the pool's queues.
+		chunk_size = max(chunk_auto(len(rec_data), child_count, cache_size()), math.ceil(len(rec_data) / pool_cached["jobs"]))
+		pool_sort(pool_cached, len(rec_data), rec_type, chunk_size)
+		num_sorted = num_view.tolist()
+		num_view.release()
+	finally:
+		status_print = status_saved
+	return num_sorted
+
+#==================================================================================================================================
+
+# Stop the warm pool when the program exits. A child forked by the caller inherits this hook, but not the pool.
+def parallel_exit():
+	global pool_cached
+	if pool_cached is not None and pool_cached["owner"] == os.getpid():
+		pool_shutdown(pool_cached)
+	pool_cached = None
+	return
+
+#==================================================================================================================================
+
+pool_cached = None
+status_print = True
+trace_data = None
+atexit.register(parallel_exit)
+
+#==================================================================================================================================
+
 if __name__ == "__main__":
+	# Run the bench instead of a sort if asked, with an optional max size, comma separated child counts, and results file.
+	if len(sys.argv) > 1 and sys.argv[1] == "bench":
+		bench_max = BENCH_MAX
+		child_counts = [2 ** temp_power for temp_power in range(int(math.log2(os.cpu_count())) + 1)]
+		out_name = "./bench.json"
+		try:
+			if len(sys.argv) > 2:
+				bench_max = int(sys.argv[2])
+			if len(sys.argv) > 3:
+				child_counts = [int(temp_count) for temp_count in sys.argv[3].split(",")]
+			if bench_max < BENCH_MIN or min(child_counts) <= 0:
+				throw()
+		except:
+			print("Error: Bench arguments must be a max size of at least " + str(BENCH_MIN) + ", and comma separated positive child counts.")
+			exit()
+		if len(sys.argv) > 4:
+			out_name = sys.argv[4]
+		bench_setup(bench_max, child_counts, out_name)
+		exit()
 	client_clear()
 	# Generate a default input file.
 	file_name = "./debug.txt"
@@ -316,9 +1497,49 @@ if __name__ == "__main__":
 			server_status("Error: The second command line arugment must be a positive Integer")
 			exit()
 	server_status("Set child count to " + str(child_count))
-	file_handle = open(file_name, "r")
-	file_data = file_read(file_name)
-	server_setup(file_data, child_count)
+	# Check that the sort mode argument is valid.
+	sort_mode = "merge"
+	if len(sys.argv) > 3:
+		sort_mode = sys.argv[3]
+		if sort_mode not in SORT_MODES:
+			server_status("Error: The third command line argument must be one of " + str(SORT_MODES))
+			exit()
+	server_status("Set sort mode to " + sort_mode)
+	# Check that the chunk size argument is valid, where auto picks one to suit the input and the machine.
+	chunk_size = 0
+	if len(sys.argv) > 4 and sys.argv[4] != "auto":
+		try:
+			chunk_size = int(sys.argv[4])
+			if chunk_size <= 0:
+				throw()
+		except:
+			server_status("Error: The fourth command line argument must be a positive Integer or auto")
+			exit()
+	# Set the output file, where a .i64 or .f64 extension writes raw records instead of text.
+	out_name = "./sorted.txt"
+	if len(sys.argv) > 5:
+		out_name = sys.argv[5]
+	server_status("Set output file to " + out_name)
+	# Check that the record type argument is valid.
+	rec_type = record_parse("int")
+	if len(sys.argv) > 6:
+		rec_type = record_parse(sys.argv[6])
+		if rec_type is None:
+			server_status("Error: The sixth command line argument must be int, float, pair, or bytes followed by a length")
+			exit()
+	server_status("Set record type to " + rec_type[0])
+	# Turn on tracing if a trace file is given.
+	trace_name = None
+	if len(sys.argv) > 7:
+		trace_name = sys.argv[7]
+		trace_setup()
+	# An external sort never reads the whole input into memory.
+	if sort_mode == "external":
+		external_start(file_name, child_count, chunk_size, out_name, rec_type)
+	else:
+		server_setup(file_name, child_count, sort_mode, chunk_size, out_name, rec_type)
+	if trace_name:
+		trace_export(trace_name)
 	exit()
 
 #==================================================================================================================================
\ No newline at end of file